@@ -1,13 +1,116 @@
 import customtkinter
 import tkinter as tk
 from tkinter import messagebox
+import collections
+import importlib
 import threading
-import queue
-import agent_logic
-import traceback
+import time
+
+class HistoryWindow(customtkinter.CTkToplevel):
+    """Searches the task history store one page at a time; nothing beyond the current page is kept in Tk."""
+    PAGE_SIZE = 50
+
+    def __init__(self, master, history):
+        super().__init__(master)
+        self.history = history
+        self.query = ""
+        self.offset = 0
+        self.total = 0
+        self.result_rows = []
+        self.title("Task History")
+        self.geometry("1000x600")
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_columnconfigure(1, weight=2)
+        self.grid_rowconfigure(1, weight=1)
+
+        search_frame = customtkinter.CTkFrame(self, fg_color="transparent")
+        search_frame.grid(row=0, column=0, columnspan=2, padx=10, pady=10, sticky="ew")
+        search_frame.grid_columnconfigure(0, weight=1)
+        self.search_entry = customtkinter.CTkEntry(search_frame, placeholder_text="Search commands, results and logs...")
+        self.search_entry.grid(row=0, column=0, padx=(0, 5), sticky="ew")
+        self.search_entry.bind("<Return>", lambda event: self.search())
+        customtkinter.CTkButton(search_frame, text="Search", width=80, command=self.search).grid(row=0, column=1)
+
+        self.results_frame = customtkinter.CTkScrollableFrame(self)
+        self.results_frame.grid(row=1, column=0, padx=(10, 5), pady=0, sticky="nsew")
+        self.results_frame.grid_columnconfigure(0, weight=1)
+        self.detail_textbox = customtkinter.CTkTextbox(self, wrap=tk.WORD, state="disabled", font=("Consolas", 12))
+        self.detail_textbox.grid(row=1, column=1, padx=(5, 10), pady=0, sticky="nsew")
+
+        page_frame = customtkinter.CTkFrame(self, fg_color="transparent")
+        page_frame.grid(row=2, column=0, padx=10, pady=10, sticky="ew")
+        page_frame.grid_columnconfigure(1, weight=1)
+        self.prev_button = customtkinter.CTkButton(page_frame, text="< Newer", width=80, command=lambda: self._load_page(self.offset - self.PAGE_SIZE))
+        self.prev_button.grid(row=0, column=0)
+        self.page_label = customtkinter.CTkLabel(page_frame, text="")
+        self.page_label.grid(row=0, column=1)
+        self.next_button = customtkinter.CTkButton(page_frame, text="Older >", width=80, command=lambda: self._load_page(self.offset + self.PAGE_SIZE))
+        self.next_button.grid(row=0, column=2)
+        self.search()
+
+    def search(self):
+        self.query = self.search_entry.get().strip()
+        try:
+            self.total = self.history.count(self.query)
+        except Exception as e:
+            self.total = 0
+            print(f"Error searching task history: {e}")
+        self._load_page(0)
+
+    def _load_page(self, offset: int):
+        self.offset = max(0, offset)
+        try:
+            entries = self.history.search(self.query, limit=self.PAGE_SIZE, offset=self.offset)
+        except Exception as e:
+            entries = []
+            print(f"Error searching task history: {e}")
+        for row in self.result_rows:
+            row.destroy()
+        self.result_rows = []
+        for index, entry in enumerate(entries):
+            finished = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["finished_at"])) if entry["finished_at"] else "?"
+            command = entry["command"] if len(entry["command"]) <= 60 else entry["command"][:57] + "..."
+            row = customtkinter.CTkButton(
+                self.results_frame, text=f"{finished} [{entry['status']}] {command}", anchor="w", fg_color="transparent",
+                text_color=("gray10", "gray90"), hover_color=("gray75", "gray25"),
+                command=lambda history_id=entry["id"]: self._show_entry(history_id)
+            )
+            row.grid(row=index, column=0, padx=2, pady=1, sticky="ew")
+            self.result_rows.append(row)
+        if entries:
+            self.page_label.configure(text=f"{self.offset + 1}-{self.offset + len(entries)} of {self.total}")
+        else:
+            self.page_label.configure(text="No matching tasks.")
+        self.prev_button.configure(state="normal" if self.offset > 0 else "disabled")
+        self.next_button.configure(state="normal" if self.offset + len(entries) < self.total else "disabled")
+
+    def _show_entry(self, history_id: int):
+        entry = self.history.get(history_id)
+        if entry is None:
+            return
+        finished = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["finished_at"])) if entry["finished_at"] else "?"
+        text = [
+            f"Command: {entry['command']}",
+            f"Status: {entry['status']}   Finished: {finished}",
+        ]
+        if entry["model"]:
+            text.append(f"Model: {entry['model']}   Tokens: {entry['tokens_in'] or 0} in / {entry['tokens_out'] or 0} out")
+        text += ["", "--- Final Output ---", entry["final_output"] or ""]
+        if entry["timing_summary"]:
+            text += ["", "--- Timing ---", entry["timing_summary"]]
+        if entry["logs"]:
+            text += ["", "--- Logs ---", entry["logs"]]
+        self.detail_textbox.configure(state="normal")
+        self.detail_textbox.delete("1.0", tk.END)
+        self.detail_textbox.insert("1.0", "\n".join(text))
+        self.detail_textbox.configure(state="disabled")
+
 
 class AgentApp(customtkinter.CTk):
     PASSWORD = "test"
+    LOG_VIEW_MAX_LINES = 2000 # Log lines kept per task and shown in the log pane
+    CHAT_VIEW_MAX_LINES = 2000 # Older chat lines are dropped; finished tasks stay searchable in History
+    TASK_LIST_MAX_ROWS = 100 # Oldest finished tasks are dropped from the list (and from memory) beyond this
 
     def __init__(self):
         super().__init__()
@@ -15,9 +118,26 @@ class AgentApp(customtkinter.CTk):
         self.geometry("1200x700")
         customtkinter.set_appearance_mode("System")
         customtkinter.set_default_color_theme("blue")
-        self.agent_running = False
-        self.log_queue = queue.Queue()
+        self.agent_running = False # True while the log/status poller is scheduled
+        self.scheduler = None # Set once the agent backend has loaded in the background
+        self.backend_ready = threading.Event()
+        self.backend_lock = threading.Lock() # Guards scheduler/closed between the loader thread and destroy()
+        self.closed = False
+        self.backend_error = None
+        self.pending_messages = [] # Commands sent before the backend finished loading
+        self.backend_announced = False
+        self.task_logs = {} # task id -> log lines received so far
+        self.task_rows = {} # task id -> button in the task list
+        self.task_event_counts = {} # task id -> step events already shown
+        self.task_row_count = 0 # Grid rows used in the task list so far
+        self.history_window = None
+        self.reported_task_ids = set() # finished tasks already posted to chat
+        self.selected_task_id = None
         self.queue_polling_id = None
+        # Load langchain/browser_use and warm the browsers while the password prompt is up.
+        # Not a daemon: if the window closes first, the loader still gets to shut down what it started.
+        self.startup_started = time.perf_counter()
+        threading.Thread(target=self._load_backend, name="backend-loader").start()
         self.check_password()
 
     def check_password(self):
@@ -103,17 +223,34 @@ class AgentApp(customtkinter.CTk):
             # font=(chat_font_family, main_font_size)
         )
         self.send_button.grid(row=0, column=1, sticky="e")
+        self.stop_button = customtkinter.CTkButton(
+            self.input_frame, text="Stop", width=80, command=self.stop_selected_task,
+            fg_color=("#C0392B", "#A93226"), hover_color=("#922B21", "#7B241C")
+        )
+        self.stop_button.grid(row=0, column=2, padx=(5, 0), sticky="e")
 
         # --- Output Pane ---
         self.output_frame = customtkinter.CTkFrame(self, corner_radius=0)
         self.output_frame.grid(row=0, column=2, sticky="nsew")
-        self.output_frame.grid_rowconfigure(1, weight=1)
+        self.output_frame.grid_rowconfigure(3, weight=1)
         self.output_frame.grid_columnconfigure(0, weight=1)
+        self.tasks_label = customtkinter.CTkLabel(
+            self.output_frame, text="Tasks",
+            font=customtkinter.CTkFont(size=16, weight="bold")
+        )
+        self.tasks_label.grid(row=0, column=0, padx=10, pady=(10, 5), sticky="w")
+        self.history_button = customtkinter.CTkButton(
+            self.output_frame, text="History", width=80, command=self.open_history_window
+        )
+        self.history_button.grid(row=0, column=0, padx=10, pady=(10, 5), sticky="e")
+        self.task_list_frame = customtkinter.CTkScrollableFrame(self.output_frame, height=160)
+        self.task_list_frame.grid(row=1, column=0, padx=10, pady=(0, 5), sticky="ew")
+        self.task_list_frame.grid_columnconfigure(0, weight=1)
         self.output_label = customtkinter.CTkLabel(
-            self.output_frame, text="Final Output / Result",
+            self.output_frame, text="Progress / Final Output",
             font=customtkinter.CTkFont(size=16, weight="bold") # Keep heading size maybe
         )
-        self.output_label.grid(row=0, column=0, padx=10, pady=(10, 5), sticky="w")
+        self.output_label.grid(row=2, column=0, padx=10, pady=(5, 5), sticky="w")
         self.output_textbox = customtkinter.CTkTextbox(
             self.output_frame,
             wrap=tk.WORD,
@@ -121,17 +258,66 @@ class AgentApp(customtkinter.CTk):
             # --- UPDATED FONT ---
             font=(mono_font_family, main_font_size)
         )
-        self.output_textbox.grid(row=1, column=0, padx=10, pady=(0, 10), sticky="nsew")
+        self.output_textbox.grid(row=3, column=0, padx=10, pady=(0, 10), sticky="nsew")
         self._update_textbox(self.output_textbox, "No task performed yet.")
+        self._poll_backend()
+
+    def _load_backend(self):
+        """Imports agent_logic, builds the runner and starts warming browsers (background thread)."""
+        try:
+            import_started = time.perf_counter()
+            agent_logic = importlib.import_module("agent_logic")
+            import_seconds = time.perf_counter() - import_started
+            scheduler = agent_logic.create_scheduler() # Also starts warming the browsers
+            with self.backend_lock:
+                closed = self.closed
+                if not closed:
+                    self.scheduler = scheduler
+            if closed:
+                print("Window closed while the agent backend was loading; shutting it down.")
+                scheduler.close()
+                return
+            self.backend_timing = (
+                f"Backend loaded in {time.perf_counter() - self.startup_started:.2f} s "
+                f"(import {import_seconds:.2f} s, of which agent_logic dependencies {agent_logic.IMPORT_SECONDS:.2f} s)."
+            )
+        except Exception as e:
+            self.backend_error = e
+            self.backend_timing = f"Failed to load agent backend: {type(e).__name__}: {e}"
+        print(self.backend_timing)
+        self.backend_ready.set() # Picked up by _poll_backend on the main thread
+
+    def _poll_backend(self):
+        """Waits on the main thread for the loader; Tk must not be called from the loader's thread."""
+        if self.closed:
+            return
+        if self.backend_ready.is_set():
+            self._on_backend_ready()
+        else:
+            self.after(100, self._poll_backend)
+
+    def _on_backend_ready(self):
+        """Runs on the main thread once the backend has loaded; starts any queued commands."""
+        if self.backend_announced:
+            return
+        self.backend_announced = True
+        if self.selected_task_id is None:
+            self._update_textbox(self.thinking_textbox, self.backend_timing, append=True)
+        if self.backend_error is not None:
+            self._append_chat_history(f"AI: {self.backend_timing}")
+            return
+        pending, self.pending_messages = self.pending_messages, []
+        for user_message in pending:
+            self._submit_task(user_message)
 
     def _update_textbox(self, textbox: customtkinter.CTkTextbox, text: str, append=False):
         try:
             textbox.configure(state="normal")
             text_str = str(text) # Ensure string
             if append:
-                # Check if textbox currently ends with a newline
-                current_content = textbox.get("1.0", "end-1c")
-                if current_content and not current_content.endswith('\n'):
+                # Check if textbox currently ends with a newline (last character only, not the whole buffer)
+                last_char = textbox.get("end-2c", "end-1c")
+                if last_char and last_char != '\n':
                      textbox.insert(tk.END, "\n" + text_str)
                 else:
                      textbox.insert(tk.END, text_str)
@@ -151,130 +337,210 @@ class AgentApp(customtkinter.CTk):
     def _append_chat_history(self, text: str):
          self.chat_history_textbox.configure(state="normal")
          self.chat_history_textbox.insert(tk.END, str(text) + "\n\n")
+         line_count = int(self.chat_history_textbox.index("end-1c").split(".")[0])
+         if line_count > self.CHAT_VIEW_MAX_LINES:
+             self.chat_history_textbox.delete("1.0", f"{line_count - self.CHAT_VIEW_MAX_LINES + 1}.0")
          self.chat_history_textbox.configure(state="disabled")
          self.chat_history_textbox.see(tk.END)
 
     def send_message_event(self, event=None):
-        if self.agent_running:
-            messagebox.showwarning("Busy", "Agent is currently processing a command. Please wait.")
-            return
-
         user_message = self.message_entry.get().strip()
         if not user_message:
             return
 
         self.message_entry.delete(0, tk.END)
-        self._append_chat_history(f"You: {user_message}")
 
-        # Clear previous logs and output before starting
-        self._update_textbox(self.thinking_textbox, "") # Clear logs completely
-        self._update_textbox(self.output_textbox, "Processing...")
+        if self.backend_error is not None:
+            self._append_chat_history(f"You: {user_message}\nAI: {self.backend_timing}")
+            return
+        if self.scheduler is None or self.pending_messages:
+            # First task waits for the backend to finish loading
+            self.pending_messages.append(user_message)
+            self._append_chat_history(f"You: {user_message}\n(Agent is still loading; this command will start as soon as it is ready.)")
+            return
+        self._submit_task(user_message)
 
-        self.message_entry.configure(state="disabled")
-        self.send_button.configure(state="disabled")
-        self.agent_running = True
 
-        # Ensure the queue is empty before starting a new task
-        while not self.log_queue.empty():
-            try:
-                self.log_queue.get_nowait()
-            except queue.Empty:
-                break
+    def _submit_task(self, user_message: str):
+        # Queue the task; the scheduler runs it as soon as a slot is free
+        task = self.scheduler.submit(user_message)
+        self.task_logs[task.id] = collections.deque(maxlen=self.LOG_VIEW_MAX_LINES)
+        self.task_event_counts[task.id] = 0
+        self._append_chat_history(f"You (task #{task.id}): {user_message}")
+        self._add_task_row(task)
+        self._select_task(task.id)
 
-        # Start the agent thread, passing the queue
-        thread = threading.Thread(
-            target=self._run_agent_thread,
-            args=(user_message, self.log_queue), # Pass queue here
-            daemon=True
-        )
-        thread.start()
+        # Start polling task logs and status if not already running
+        if not self.agent_running:
+            self.agent_running = True
+            self.process_log_queue()
 
-        # Start polling the log queue
-        self.process_log_queue()
+
+    def open_history_window(self):
+        """Opens (or raises) the searchable history of finished tasks."""
+        history = getattr(self.scheduler, "history", None)
+        if history is None:
+            messagebox.showinfo("Task History", "Task history is not available (still loading, or TASK_HISTORY_PATH=off).")
+            return
+        if self.history_window is None or not self.history_window.winfo_exists():
+            self.history_window = HistoryWindow(self, history)
+        else:
+            self.history_window.search() # Pick up tasks finished since it was opened
+        self.history_window.focus()
+
+
+    def stop_selected_task(self):
+        """Cancels the task selected in the task list; its browser is freed right away."""
+        if self.scheduler is None or self.selected_task_id is None:
+            return
+        if self.scheduler.cancel(self.selected_task_id):
+            self._append_chat_history(f"You: Stop task #{self.selected_task_id}")
 
 
     def process_log_queue(self):
-        """Periodically check the log queue and update the thinking textbox."""
-        try:
-            messages_processed = 0
-            while messages_processed < 10: # Process up to 10 messages per cycle to prevent blocking GUI
-                log_entry = self.log_queue.get_nowait()
-                # Use append=True for subsequent messages
-                is_first_message = self.thinking_textbox.get("1.0", "end-1c") == ""
-                self._update_textbox(self.thinking_textbox, log_entry, append=not is_first_message)
-                messages_processed += 1
-
-        except queue.Empty:
-            pass # No messages currently in queue
-        except Exception as e:
-            print(f"Error processing log queue: {e}")
-            # Optionally log this error to the textbox itself
-            self._update_textbox(self.thinking_textbox, f"\n--- GUI Error processing logs: {e} ---", append=True)
+        """Periodically drain every active task's log queue and refresh the task list."""
+        active = False
+        for task in self.scheduler.list_tasks():
+            if task.id in self.reported_task_ids:
+                continue
+            finished = task.finished # Read before draining so no final log line is missed
+            try:
+                # Take everything queued since the last tick as one batch
+                log_entries = task.log_queue.drain()
+                if log_entries:
+                    self.task_logs[task.id].extend(log_entries)
+                    if task.id == self.selected_task_id:
+                        self._append_log_lines(log_entries)
+            except Exception as e:
+                print(f"Error processing log queue: {e}")
+                self._update_textbox(self.thinking_textbox, f"\n--- GUI Error processing logs: {e} ---", append=True)
+
+            # Show each finished step in the output pane without waiting for the whole task
+            shown = self.task_event_counts.get(task.id, 0)
+            new_events = task.events[shown:]
+            if new_events:
+                self.task_event_counts[task.id] = shown + len(new_events)
+                steps = [event for event in new_events if event.get("type") == "step"]
+                if steps and task.id == self.selected_task_id and not finished:
+                    if shown == 0:
+                        self._show_task_output(task) # Replaces the "Queued..." header
+                    else:
+                        self._update_textbox(self.output_textbox, "\n".join(self._format_step(event) for event in steps), append=True)
+
+            self._refresh_task_row(task)
+            if finished and task.log_queue.empty():
+                self._report_task_result(task)
+            else:
+                active = True
 
-        # Reschedule polling only if the agent is still running
-        if self.agent_running:
+        # Reschedule polling only while some task is still queued, running or unreported
+        self.agent_running = active
+        if active:
             self.queue_polling_id = self.after(100, self.process_log_queue) # Poll every 100ms
+        else:
+            self.queue_polling_id = None
 
 
-    def _run_agent_thread(self, user_message, log_queue):
-        """Runs the agent task in a separate thread."""
+    def _append_log_lines(self, lines):
+        """Appends a batch of log lines with a single insert and trims the pane to the newest lines."""
+        self._update_textbox(self.thinking_textbox, "\n".join(lines), append=True)
         try:
-            results = agent_logic.agent_runner_instance.run_task(user_message, log_queue)
-            self.after(0, self._update_ui_from_agent, results) # Schedule UI update on main thread
+            line_count = int(self.thinking_textbox.index("end-1c").split(".")[0])
+            if line_count > self.LOG_VIEW_MAX_LINES:
+                self.thinking_textbox.configure(state="normal")
+                self.thinking_textbox.delete("1.0", f"{line_count - self.LOG_VIEW_MAX_LINES + 1}.0")
+                self.thinking_textbox.configure(state="disabled")
         except Exception as e:
-            print(f"Error directly in worker thread execution: {e}\n{traceback.format_exc()}")
-            error_message = f"Critical error in agent thread: {e}"
-            results_on_error = {
-                 "chat_response": "System error in worker thread.",
-                 "final_output": f"Failed: {e}"
-            }
-            # Try to log the error via queue
-            try:
-                log_queue.put(f"FATAL    [GUI Thread] {error_message}\n{traceback.format_exc()}")
-                log_queue.put("--- AGENT TASK FAILED (THREAD CRASH) ---")
-            except:
-                pass
-            # Still schedule UI update
-            self.after(0, self._update_ui_from_agent, results_on_error)
+            print(f"Error trimming log pane: {e}")
 
 
-    def _update_ui_from_agent(self, results: dict):
-        """Called when the agent task function returns (on main thread)."""
-        # Stop polling the queue FIRST
-        self.agent_running = False
-        if self.queue_polling_id:
-            self.after_cancel(self.queue_polling_id)
-            self.queue_polling_id = None
+    def _report_task_result(self, task):
+        """Posts a finished task's result to chat, and to the output pane if it is selected."""
+        self.reported_task_ids.add(task.id)
+        results = task.result or {}
+        chat = results.get("chat_response", "Agent did not provide a chat response.")
+        self._append_chat_history(f"AI (task #{task.id}): {chat}")
+        if task.id == self.selected_task_id:
+            self._update_textbox(self.output_textbox, self._format_output(results))
+        self._prune_task_rows()
 
-        # Process any final messages that might have arrived just before stopping
-        self.process_log_queue()
 
-        # Update chat and output panes
-        chat = results.get("chat_response", "Agent did not provide a chat response.")
+    def _prune_task_rows(self):
+        """Drops the oldest reported tasks beyond TASK_LIST_MAX_ROWS; they remain in the history store."""
+        for task_id in list(self.task_rows):
+            if len(self.task_rows) <= self.TASK_LIST_MAX_ROWS:
+                break
+            if task_id not in self.reported_task_ids or task_id == self.selected_task_id:
+                continue
+            self.task_rows.pop(task_id).destroy()
+            self.task_logs.pop(task_id, None)
+            self.task_event_counts.pop(task_id, None)
+            self.reported_task_ids.discard(task_id)
+            self.scheduler.discard(task_id)
+
+
+    def _format_output(self, results: dict) -> str:
+        """Final output followed by the task's timing breakdown, when there is one."""
         output = results.get("final_output", "No final output received.")
+        if results.get("timing_summary"):
+            output += "\n\n--- Timing ---\n" + results["timing_summary"]
+        if results.get("trace_path"):
+            output += f"\nTrace: {results['trace_path']}"
+        return output
+
+
+    def _format_step(self, event: dict) -> str:
+        """One finished agent step as shown in the output pane while a task runs."""
+        actions = ", ".join(next(iter(action), "unknown") for action in event.get("actions", [])) or "no action"
+        lines = [f"Step {event.get('step')}: {actions}" + (" (done)" if event.get("is_done") else "")]
+        if event.get("next_goal"):
+            lines.append(f"  Goal: {event['next_goal']}")
+        for content in event.get("extracted_content", []):
+            lines.append(f"  Result: {content if len(content) <= 500 else content[:497] + '...'}")
+        for error in event.get("errors", []):
+            lines.append(f"  Error: {error.strip().splitlines()[-1] if error.strip() else error}")
+        return "\n".join(lines) + "\n"
+
+
+    def _add_task_row(self, task):
+        row = customtkinter.CTkButton(
+            self.task_list_frame, text="", anchor="w", fg_color="transparent",
+            text_color=("gray10", "gray90"), hover_color=("gray75", "gray25"),
+            command=lambda task_id=task.id: self._select_task(task_id)
+        )
+        row.grid(row=self.task_row_count, column=0, padx=2, pady=1, sticky="ew")
+        self.task_row_count += 1
+        self.task_rows[task.id] = row
+        self._refresh_task_row(task)
+
 
-        self._append_chat_history(f"AI: {chat}")
-        self._update_textbox(self.output_textbox, output)
+    def _refresh_task_row(self, task):
+        row = self.task_rows.get(task.id)
+        if row is None:
+            return
+        command = task.command if len(task.command) <= 40 else task.command[:37] + "..."
+        text = f"#{task.id} [{task.status}] {command}"
+        if row.cget("text") != text:
+            row.configure(text=text)
 
-        self._enable_input() # Re-enable input fields AFTER everything is done
 
+    def _select_task(self, task_id):
+        """Shows the selected task's logs and output in the log and output panes."""
+        self.selected_task_id = task_id
+        task = self.scheduler.get(task_id)
+        self._update_textbox(self.thinking_textbox, "\n".join(self.task_logs.get(task_id, [])))
+        if task is not None:
+            self._show_task_output(task)
 
-    def _enable_input(self):
-         """Re-enables input fields and ensures polling is stopped."""
-         if self.queue_polling_id:
-             try:
-                 self.after_cancel(self.queue_polling_id)
-             except ValueError: # May happen if ID is invalid (already cancelled)
-                 pass
-             self.queue_polling_id = None
-         self.agent_running = False # Ensure state is correct
 
-         # Ensure widgets exist before configuring (safety check)
-         if hasattr(self, 'message_entry') and self.message_entry.winfo_exists():
-             self.message_entry.configure(state="normal")
-             self.message_entry.focus()
-         if hasattr(self, 'send_button') and self.send_button.winfo_exists():
-             self.send_button.configure(state="normal")
+    def _show_task_output(self, task):
+        """Fills the output pane with the final output, or the steps finished so far."""
+        if task.finished and task.result:
+            self._update_textbox(self.output_textbox, self._format_output(task.result))
+        else:
+            steps = [self._format_step(event) for event in task.events[:self.task_event_counts.get(task.id, 0)] if event.get("type") == "step"]
+            status = "Queued..." if task.status == "queued" else "Processing..."
+            self._update_textbox(self.output_textbox, "\n".join([status + "\n"] + steps))
 
 
     def destroy(self):
@@ -287,6 +553,11 @@ class AgentApp(customtkinter.CTk):
             except ValueError:
                 pass
             self.queue_polling_id = None
+        with self.backend_lock:
+            self.closed = True # A loader still running closes its scheduler itself
+            scheduler = self.scheduler
+        if scheduler is not None:
+            scheduler.close() # Shut down pooled browsers and the loop thread or worker processes
         super().destroy()
 
 
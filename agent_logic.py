@@ -1,16 +1,120 @@
+import time
+_import_started = time.perf_counter()
 import os
+import sys
+import json
+import argparse
 import asyncio
 import traceback
 import logging
 import io
 import queue
+import threading
+import concurrent.futures
+import contextvars
+import collections
+import multiprocessing
+import itertools
+import re
+import hashlib
+import ipaddress
+import sqlite3
+import contextlib
+import copy
+import uuid
+from urllib.parse import urlparse
+import psutil
 from pydantic import BaseModel, SecretStr
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
+from langchain_core.rate_limiters import InMemoryRateLimiter
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import AIMessage, HumanMessage
 from browser_use import Agent, Browser, BrowserConfig, Controller
+from browser_use.browser.context import BrowserContext
+from browser_use.agent.views import ActionResult
 
 load_dotenv()
 
+# Seconds spent importing this module and its dependencies, for tracking startup cost
+IMPORT_SECONDS = time.perf_counter() - _import_started
+
+logger = logging.getLogger("agent_logic")
+
+
+def _env_int(name: str, default: int) -> int:
+    """Reads an integer setting from the environment (.env), falling back to default."""
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    """Reads a true/false setting from the environment (.env), falling back to default."""
+    value = os.getenv(name)
+    if value is None or not value.strip():
+        return default
+    return value.strip().lower() not in ("0", "false", "no", "off")
+
+
+def _env_float(name: str, default: float) -> float:
+    """Reads a float setting from the environment (.env), falling back to default."""
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+# Log queue of the task running in the current asyncio context, so concurrent
+# tasks sharing the browser_use loggers only see their own records.
+_active_log_queue = contextvars.ContextVar("active_log_queue", default=None)
+
+# --- Bounded Log Queue ---
+class BoundedLogQueue(queue.Queue):
+    """Log queue that never blocks producers.
+
+    When the consumer falls behind and the queue is full, the oldest lines are
+    dropped and counted; the next drain() reports how many were lost. Consumers
+    take everything available in one batch with drain(). With `keep_recent` the
+    last lines put are also kept in `recent`, whatever the consumer does.
+    """
+    def __init__(self, maxsize: int = 5000, keep_recent: int = 0):
+        super().__init__(maxsize=max(1, maxsize))
+        self.dropped = 0
+        self.recent = collections.deque(maxlen=keep_recent)
+
+    def put(self, item, block=True, timeout=None):
+        with self.mutex:
+            if self.recent.maxlen:
+                self.recent.append(item)
+            while self._qsize() >= self.maxsize:
+                self.queue.popleft()
+                self.unfinished_tasks -= 1
+                self.dropped += 1
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+
+    def drain(self) -> list:
+        """Removes and returns every queued line, preceded by a summary of any dropped lines."""
+        with self.mutex:
+            items = list(self.queue)
+            self.queue.clear()
+            self.unfinished_tasks -= len(items)
+            dropped, self.dropped = self.dropped, 0
+            if self.unfinished_tasks <= 0:
+                self.unfinished_tasks = 0
+                self.all_tasks_done.notify_all()
+            self.not_full.notify_all()
+        if dropped:
+            items.insert(0, f"WARNING  [system] {dropped} earlier log lines dropped while the display caught up.")
+        return items
+
+# Lines buffered per task before the oldest are dropped
+LOG_QUEUE_MAX_LINES = _env_int("LOG_QUEUE_MAX_LINES", 5000)
+
 # --- Custom Log Handler ---
 class QueueHandler(logging.Handler):
     """Sends log records to a queue."""
@@ -23,50 +127,1349 @@ class QueueHandler(logging.Handler):
         self.setLevel(logging.INFO)
 
     def emit(self, record):
+        active_queue = _active_log_queue.get()
+        if active_queue is not None and active_queue is not self.log_queue:
+            return # Record belongs to another concurrently running task
         self.log_queue.put(self.format(record))
 
 # --- Logger names used by browser_use (based on console output) ---
 LOGGER_NAMES = ['agent', 'controller', 'browser', 'browser_use'] # Add 'browser_use' based on initial setup message
 
-class SimpleAgentRunner:
+# --- Warm Browser Pool ---
+class PooledBrowser:
+    """A launched browser plus the pre-warmed context the next task will use."""
+    def __init__(self, browser: Browser):
+        self.browser = browser
+        self.context = None
+        self.uses = 0
+
+
+def _is_shared_browser(browser_config: BrowserConfig) -> bool:
+    """True when browser_use attaches to an already running Chrome (chrome_instance_path or
+    cdp_url). It then drives that Chrome's default context instead of creating a new one."""
+    return bool(browser_config.chrome_instance_path or browser_config.cdp_url)
+
+
+class BrowserPool:
+    """Keeps pre-launched browsers warm and hands out a fresh context per task.
+
+    Each checkout gets its own BrowserContext, so cookies, storage and tabs never
+    leak between tasks. Browsers are relaunched after `max_uses` checkouts, when
+    they stop responding, or when their process tree exceeds `max_memory_mb`
+    (0 disables the memory check). Closing a context or browser that hangs for
+    longer than `close_timeout` seconds is abandoned and the browser relaunched.
+
+    A config with `chrome_instance_path` or `cdp_url` attaches to a running Chrome,
+    whose default context can't be replaced (`shared`). The pool then holds that one
+    browser and keeps its context between tasks, so cookies and tabs carry over;
+    a size above 1 is refused because every slot would drive the same Chrome.
+    """
+    def __init__(self, browser_config: BrowserConfig, size: int = 1, max_uses: int = 20, max_memory_mb: int = 0, close_timeout: float = 10.0):
+        self.browser_config = browser_config
+        self.shared = _is_shared_browser(browser_config)
+        if self.shared and size > 1:
+            raise ValueError(
+                f"A pool of {size} browsers can't attach to one running Chrome (chrome_instance_path/cdp_url); "
+                "use a pool size of 1 or a browser_config that launches its own browsers."
+            )
+        self.size = max(1, size)
+        self.max_uses = max(1, max_uses)
+        self.max_memory_mb = max_memory_mb
+        self.close_timeout = close_timeout
+        self._idle = None # asyncio.Queue, created on the loop that owns the browsers
+        self._slots = []
+        self._resets = set() # Background _reset tasks; referenced so they aren't garbage collected mid-run
+        self._start_lock = None
+
+    async def start(self):
+        """Launches `size` browsers with a warm context each. Safe to call repeatedly."""
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self._idle is not None:
+                return
+            launches = [asyncio.ensure_future(self._launch()) for _ in range(self.size)]
+            errors = []
+            try:
+                results = await asyncio.gather(*launches, return_exceptions=True)
+            except asyncio.CancelledError as e:
+                # gather cancelled the launches still running; wait for them to clean up
+                results = await asyncio.gather(*launches, return_exceptions=True)
+                errors.append(e)
+            slots = [result for result in results if isinstance(result, PooledBrowser)]
+            errors += [result for result in results if isinstance(result, BaseException)]
+            if errors: # Don't leak the browsers that did launch
+                await asyncio.gather(*(self._close_slot(slot) for slot in slots))
+                raise errors[0]
+            idle = asyncio.Queue()
+            for slot in slots:
+                self._slots.append(slot)
+                idle.put_nowait(slot)
+            self._idle = idle
+
+    async def acquire(self) -> PooledBrowser:
+        """Checks out a browser whose context is ready for the next task."""
+        await self.start()
+        slot = await self._idle.get()
+        try:
+            if not self._is_healthy(slot):
+                logger.warning("Pooled browser is no longer connected, relaunching.")
+                slot = await self._recycle(slot)
+            if slot.context is None:
+                slot.context = await self._new_context(slot.browser)
+        except BaseException:
+            self._idle.put_nowait(slot)
+            raise
+        slot.uses += 1
+        return slot
+
+    def release(self, slot: PooledBrowser):
+        """Returns a browser to the pool; its context is reset in the background."""
+        reset = asyncio.ensure_future(self._reset(slot))
+        self._resets.add(reset)
+        reset.add_done_callback(self._resets.discard)
+
+    @property
+    def resets(self) -> set:
+        """Context resets still running in the background."""
+        return set(self._resets)
+
+    async def close(self):
+        """Closes every browser owned by the pool, once resets in progress have returned their slots."""
+        if self._resets:
+            _, pending = await asyncio.wait(self.resets, timeout=self.close_timeout)
+            for reset in pending:
+                reset.cancel() # Its finally still hands the slot back before the slots are closed below
+            if pending:
+                await asyncio.wait(pending)
+        slots, self._slots = self._slots, []
+        self._idle = None
+        for slot in slots:
+            await self._close_slot(slot)
+
+    async def _reset(self, slot: PooledBrowser):
+        try:
+            stuck = False
+            if slot.context is not None and not self.shared:
+                try:
+                    await asyncio.wait_for(slot.context.close(), self.close_timeout) # Drops cookies, storage and tabs left by the task
+                except asyncio.TimeoutError:
+                    stuck = True
+                slot.context = None
+            if stuck:
+                logger.warning(f"Closing a browser context took over {self.close_timeout} s, relaunching the browser.")
+                slot = await self._recycle(slot)
+            elif slot.uses >= self.max_uses:
+                logger.info(f"Recycling browser after {slot.uses} uses.")
+                slot = await self._recycle(slot)
+            elif self.max_memory_mb and await self._memory_mb(slot) > self.max_memory_mb:
+                logger.info(f"Recycling browser above {self.max_memory_mb} MB memory ceiling.")
+                slot = await self._recycle(slot)
+            elif self._is_healthy(slot) and slot.context is None:
+                slot.context = await self._new_context(slot.browser)
+        except Exception as e:
+            logger.warning(f"Failed to reset pooled browser, it will be relaunched on checkout: {e}")
+        finally:
+            if self._idle is not None:
+                self._idle.put_nowait(slot)
+            else:
+                await self._close_slot(slot)
+
+    async def _launch(self) -> PooledBrowser:
+        slot = PooledBrowser(Browser(config=self.browser_config))
+        try:
+            await slot.browser.get_playwright_browser()
+            slot.context = await self._new_context(slot.browser)
+        except BaseException:
+            await self._close_slot(slot)
+            raise
+        return slot
+
+    async def _new_context(self, browser: Browser) -> BrowserContext:
+        context = BrowserContext(browser=browser, config=self.browser_config.new_context_config)
+        await context.get_session() # Opens the first page now rather than on the task's first action
+        return context
+
+    async def _recycle(self, slot: PooledBrowser) -> PooledBrowser:
+        await self._close_slot(slot)
+        new_slot = await self._launch()
+        self._slots = [new_slot if s is slot else s for s in self._slots]
+        return new_slot
+
+    async def _close_slot(self, slot: PooledBrowser):
+        try:
+            if slot.context is not None and not self.shared: # A shared Chrome's default context belongs to the user
+                await asyncio.wait_for(slot.context.close(), self.close_timeout)
+            await asyncio.wait_for(slot.browser.close(), self.close_timeout)
+        except Exception as e:
+            logger.warning(f"Failed to close pooled browser: {e}")
+        slot.context = None
+
+    def _is_healthy(self, slot: PooledBrowser) -> bool:
+        playwright_browser = slot.browser.playwright_browser
+        return playwright_browser is not None and playwright_browser.is_connected()
+
+    async def _memory_mb(self, slot: PooledBrowser) -> float:
+        """Resident memory of the browser's process tree, as reported by Chrome via CDP."""
+        try:
+            cdp_session = await slot.browser.playwright_browser.new_browser_cdp_session()
+            try:
+                info = await cdp_session.send("SystemInfo.getProcessInfo")
+            finally:
+                await cdp_session.detach()
+        except Exception as e:
+            logger.debug(f"Could not read browser process info: {e}")
+            return 0.0
+        total = 0
+        for process_info in info.get("processInfo", []):
+            try:
+                total += psutil.Process(int(process_info["id"])).memory_info().rss
+            except (psutil.Error, KeyError, ValueError):
+                pass
+        return total / (1024 * 1024)
+
+
+# --- Result Cache ---
+class ResultCache:
+    """SQLite-backed cache of task results with a per-entry TTL and LRU size bound.
+
+    Keys combine the normalized command text with the runner's model settings, so
+    changing the model or its parameters never serves a stale answer.
+    """
+    def __init__(self, path: str, ttl_seconds: float = 3600, max_entries: int = 1000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, command TEXT, result TEXT, created_at REAL, expires_at REAL, last_used REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def normalize(command: str) -> str:
+        """Whitespace and trailing punctuation don't change what the agent does. Case can
+        (URL paths, quoted search terms), so it is kept."""
+        return re.sub(r"\s+", " ", command).strip().rstrip(".!?").strip()
+
+    def make_key(self, command: str, config: dict) -> str:
+        payload = json.dumps({"command": self.normalize(command), "config": config}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        """Returns the cached result dict, or None on a miss or expired entry."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT result, expires_at FROM results WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] < now:
+                if row is not None:
+                    self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE results SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, command: str, result: dict, ttl_seconds: float = None):
+        """Stores a result and evicts the least recently used entries beyond max_entries."""
+        now = time.time()
+        expires_at = now + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, command, result, created_at, expires_at, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, command, json.dumps(result), now, expires_at, now),
+            )
+            self._conn.execute(
+                "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# --- Task History ---
+class TaskHistory:
+    """Append-only SQLite record of finished tasks with a full-text index.
+
+    Each row holds the command, outcome, final output, timing summary and the task's
+    last log lines. Searches (FTS5, or LIKE where SQLite lacks it) return one page
+    at a time, newest first, so callers never load the whole history.
+    """
+    def __init__(self, path: str, max_log_lines: int = 1000):
+        self.path = path
+        self.max_log_lines = max(0, max_log_lines)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        try:
+            self._conn.execute("PRAGMA journal_mode=WAL") # GUI, batch and API may share one file
+        except sqlite3.Error:
+            pass
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, command TEXT NOT NULL, status TEXT, success INTEGER, "
+            "chat_response TEXT, final_output TEXT, logs TEXT, timing_summary TEXT, model TEXT, "
+            "tokens_in INTEGER, tokens_out INTEGER, submitted_at REAL, started_at REAL, finished_at REAL)"
+        )
+        self.full_text = True
+        try:
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5("
+                "command, final_output, logs, content='tasks', content_rowid='id')"
+            )
+            self._conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS tasks_fts_insert AFTER INSERT ON tasks BEGIN "
+                "INSERT INTO tasks_fts (rowid, command, final_output, logs) VALUES (new.id, new.command, new.final_output, new.logs); END"
+            )
+        except sqlite3.OperationalError:
+            self.full_text = False # SQLite built without FTS5
+        self._conn.commit()
+
+    def add(self, task) -> int:
+        """Stores a finished ScheduledTask and returns its history id."""
+        result = task.result or {}
+        tokens = result.get("tokens") or {}
+        logs = list(task.log_queue.recent)
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO tasks (command, status, success, chat_response, final_output, logs, timing_summary, model, "
+                "tokens_in, tokens_out, submitted_at, started_at, finished_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (task.command, task.status, 1 if result.get("success") else 0, result.get("chat_response"),
+                 result.get("final_output"), "\n".join(logs[-self.max_log_lines:] if self.max_log_lines else []),
+                 result.get("timing_summary"), result.get("model"), tokens.get("input"), tokens.get("output"),
+                 task.submitted_at, task.started_at, task.finished_at),
+            )
+            self._conn.commit()
+            return cursor.lastrowid
+
+    def search(self, query: str = "", limit: int = 50, offset: int = 0) -> list:
+        """One page of matching tasks, newest first: dicts with id, command, status, success,
+        finished_at and a short snippet around the match."""
+        where, params = self._match(query)
+        if where and self.full_text:
+            sql = ("SELECT t.id, t.command, t.status, t.success, t.finished_at, snippet(tasks_fts, -1, '[', ']', '...', 12) "
+                   "FROM tasks_fts JOIN tasks t ON t.id = tasks_fts.rowid WHERE " + where + " ORDER BY t.id DESC LIMIT ? OFFSET ?")
+        else:
+            sql = ("SELECT id, command, status, success, finished_at, substr(final_output, 1, 120) FROM tasks"
+                   + (" WHERE " + where if where else "") + " ORDER BY id DESC LIMIT ? OFFSET ?")
+        with self._lock:
+            rows = self._conn.execute(sql, params + [limit, offset]).fetchall()
+        return [{"id": r[0], "command": r[1], "status": r[2], "success": bool(r[3]), "finished_at": r[4], "snippet": r[5] or ""}
+                for r in rows]
+
+    def count(self, query: str = "") -> int:
+        where, params = self._match(query)
+        table = "tasks_fts" if where and self.full_text else "tasks"
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {table}" + (" WHERE " + where if where else ""), params).fetchone()[0]
+
+    def get(self, history_id: int) -> dict:
+        """The full stored record, or None."""
+        with self._lock:
+            cursor = self._conn.execute("SELECT * FROM tasks WHERE id = ?", (history_id,))
+            row = cursor.fetchone()
+            columns = [column[0] for column in cursor.description]
+        return dict(zip(columns, row)) if row else None
+
+    def _match(self, query: str):
+        """WHERE clause and parameters for a search; every word must match (prefix match with FTS5)."""
+        words = query.split()
+        if not words:
+            return "", []
+        if self.full_text:
+            return "tasks_fts MATCH ?", [" ".join('"' + word.replace('"', '""') + '"*' for word in words)]
+        clause = " AND ".join("(command LIKE ? OR final_output LIKE ? OR logs LIKE ?)" for _ in words)
+        return clause, [f"%{word}%" for word in words for _ in range(3)]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_task_history():
+    """The history store configured by TASK_HISTORY_PATH (default task_history.sqlite; "off" disables it)."""
+    path = os.getenv("TASK_HISTORY_PATH", "task_history.sqlite").strip()
+    if not path or path.lower() == "off":
+        return None
+    try:
+        return TaskHistory(path, max_log_lines=_env_int("TASK_HISTORY_LOG_LINES", 1000))
+    except sqlite3.Error as e:
+        print(f"Error opening task history {path}: {e}")
+        return None
+
+
+# --- Session Snapshots ---
+# URLs that mean a site is asking the user to log in (again)
+DEFAULT_AUTH_URL_PATTERN = r"/(log-?in|sign-?in|signon|logon|auth|sso)\b|[?&](next|returnurl|return_to|redirect_uri|continue)=|//(accounts|login|auth|sso)\."
+
+# Puts saved localStorage back for the page's origin, without overwriting what the site has since written
+_LOCAL_STORAGE_SCRIPT = """(() => {
+    const items = (%s)[location.origin];
+    if (!items) return;
+    try {
+        for (const [key, value] of items) {
+            if (localStorage.getItem(key) === null) localStorage.setItem(key, value);
+        }
+    } catch (e) {}
+})();"""
+
+
+def _site_of(host: str) -> str:
+    """Approximate registrable domain of a host or cookie domain ("mail.example.co.uk" -> "example.co.uk").
+    IP addresses and single-label hosts such as "localhost" are their own site."""
+    host = host.strip(".").lower()
+    try:
+        return str(ipaddress.ip_address(host.strip("[]")))
+    except ValueError:
+        pass
+    labels = host.split(".")
+    keep = 3 if len(labels) > 2 and len(labels[-1]) == 2 and labels[-2] in ("co", "com", "org", "net", "gov", "ac", "edu") else 2
+    return ".".join(labels[-keep:])
+
 
+def _url_site(url: str):
+    host = urlparse(url or "").hostname
+    return _site_of(host) if host else None
+
+
+class SessionCheckout:
+    """Sites restored into one task's browser context, and those that answered with 401 since."""
+    def __init__(self, sites):
+        self.sites = set(sites)
+        self.auth_failures = set()
+
+    def on_response(self, response):
+        if response.status == 401 and response.request.resource_type == "document":
+            site = _url_site(response.url)
+            if site:
+                self.auth_failures.add(site)
+
+
+class SessionStore:
+    """Named browser session snapshots (cookies and localStorage) in SQLite, one row per site.
+
+    `restore()` loads every site saved under `name` into a pooled context before a task,
+    so the agent starts out logged in. `update()` afterwards saves the sites the task
+    visited; a restored site whose login no longer works (the failed task ended up on a
+    login page or got a 401) has its snapshot dropped instead.
+    """
+    def __init__(self, path: str, name: str = "default", auth_url_pattern: str = DEFAULT_AUTH_URL_PATTERN):
+        self.path = path
+        self.name = name
+        self.auth_url = re.compile(auth_url_pattern, re.IGNORECASE)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        try:
+            self._conn.execute("PRAGMA journal_mode=WAL") # Worker processes share the file
+        except sqlite3.Error:
+            pass
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "name TEXT NOT NULL, site TEXT NOT NULL, state TEXT NOT NULL, updated_at REAL, PRIMARY KEY (name, site))"
+        )
+        self._conn.commit()
+
+    def load(self, name: str = None) -> dict:
+        """Saved snapshots as {site: {"cookies": [...], "origins": [...]}} (Playwright storage_state layout)."""
+        with self._lock:
+            rows = self._conn.execute("SELECT site, state FROM sessions WHERE name = ?", (name or self.name,)).fetchall()
+        return {site: json.loads(state) for site, state in rows}
+
+    def save(self, site: str, state: dict, name: str = None):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (name, site, state, updated_at) VALUES (?, ?, ?, ?)",
+                (name or self.name, site, json.dumps(state), time.time()),
+            )
+            self._conn.commit()
+
+    def invalidate(self, site: str, name: str = None):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE name = ? AND site = ?", (name or self.name, site))
+            self._conn.commit()
+
+    async def restore(self, context: BrowserContext) -> SessionCheckout:
+        """Adds the saved cookies and localStorage of every site to a fresh context."""
+        snapshots = self.load()
+        playwright_context = (await context.get_session()).context
+        checkout = SessionCheckout(snapshots)
+        playwright_context.on("response", checkout.on_response)
+        now = time.time()
+        cookies = [cookie for state in snapshots.values() for cookie in state.get("cookies", [])
+                   if cookie.get("expires", -1) <= 0 or cookie["expires"] > now]
+        if cookies:
+            await playwright_context.add_cookies(cookies)
+        storage = {origin["origin"]: [[item["name"], item["value"]] for item in origin.get("localStorage", [])]
+                   for state in snapshots.values() for origin in state.get("origins", [])}
+        if storage:
+            await playwright_context.add_init_script(_LOCAL_STORAGE_SCRIPT % json.dumps(storage))
+        return checkout
+
+    async def update(self, context: BrowserContext, checkout: SessionCheckout, visited_urls: list, success: bool):
+        """Saves the visited sites' state from `context`; returns (saved sites, invalidated sites)."""
+        playwright_context = (await context.get_session()).context
+        urls = list(visited_urls) + [page.url for page in playwright_context.pages]
+        visited = {_url_site(url) for url in urls} - {None}
+        failed = set()
+        if not success:
+            failed = (checkout.auth_failures | {_url_site(url) for url in urls if self.auth_url.search(url or "")}) & checkout.sites
+        state = await playwright_context.storage_state()
+        by_site = {}
+        for cookie in state.get("cookies", []):
+            by_site.setdefault(_site_of(cookie["domain"]), {"cookies": [], "origins": []})["cookies"].append(cookie)
+        for origin in state.get("origins", []):
+            site = _url_site(origin["origin"])
+            if site:
+                by_site.setdefault(site, {"cookies": [], "origins": []})["origins"].append(origin)
+        saved, invalidated = [], []
+        for site in sorted(visited):
+            if site in failed:
+                self.invalidate(site)
+                invalidated.append(site)
+            elif site in by_site:
+                self.save(site, by_site[site])
+                saved.append(site)
+        return saved, invalidated
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# --- Fast Mode (Resource Blocking) ---
+DEFAULT_BLOCKED_RESOURCE_TYPES = ("image", "media", "font")
+# Ad, analytics and tracker hosts that extraction tasks never need
+DEFAULT_BLOCKED_URL_PATTERNS = (
+    r"doubleclick\.net", r"googlesyndication\.com", r"googleadservices\.com", r"google-analytics\.com",
+    r"googletagmanager\.com", r"adservice\.google\.", r"connect\.facebook\.net", r"amazon-adsystem\.com",
+    r"adnxs\.com", r"criteo\.(com|net)", r"taboola\.com", r"outbrain\.com", r"scorecardresearch\.com",
+    r"quantserve\.com", r"hotjar\.com", r"segment\.(io|com)", r"mixpanel\.com", r"nr-data\.net",
+)
+
+
+class ResourceStats:
+    """Requests blocked in one task's browser context, and what the allowed ones transferred."""
     def __init__(self):
-        self.llm = ChatOpenAI(
-            model="gpt-4o",
-            temperature=0.0,
-            api_key=os.getenv("OPENAI_API_KEY")
+        self.blocked = collections.Counter() # resource type (or "url" for pattern matches) -> requests
+        self.requests = 0
+        self.bytes_received = 0
+
+    async def on_request_finished(self, request):
+        self.requests += 1
+        try:
+            sizes = await request.sizes()
+            self.bytes_received += max(0, sizes["responseHeadersSize"]) + max(0, sizes["responseBodySize"])
+        except Exception:
+            pass # Page or context already gone
+
+    def to_dict(self) -> dict:
+        return {
+            "blocked_requests": sum(self.blocked.values()),
+            "blocked_by_type": dict(self.blocked),
+            "requests": self.requests,
+            "bytes_received": self.bytes_received,
+        }
+
+    def summary(self) -> str:
+        by_type = ", ".join(f"{kind} {count}" for kind, count in self.blocked.most_common())
+        return (f"{sum(self.blocked.values())} requests blocked" + (f" ({by_type})" if by_type else "")
+                + f"; {self.requests} requests completed, {self.bytes_received / 1024:.0f} KB received.")
+
+
+class ResourceBlocker:
+    """Fast mode: aborts requests for the given resource types and URL patterns in a context.
+
+    Blocked requests never leave the browser, so the bytes they would have cost can't be
+    measured; compare `bytes_received` with fast mode off to see the difference. With no
+    types or patterns configured nothing is routed and only the traffic is counted.
+    """
+    def __init__(self, resource_types=DEFAULT_BLOCKED_RESOURCE_TYPES, url_patterns=DEFAULT_BLOCKED_URL_PATTERNS):
+        self.resource_types = frozenset(resource_types)
+        self.url_pattern = re.compile("|".join(f"(?:{pattern})" for pattern in url_patterns), re.IGNORECASE) if url_patterns else None
+
+    @classmethod
+    def from_env(cls) -> "ResourceBlocker":
+        """Settings from FAST_MODE_BLOCK_TYPES and FAST_MODE_BLOCK_URLS (comma-separated; unset = defaults)."""
+        types = os.getenv("FAST_MODE_BLOCK_TYPES")
+        patterns = os.getenv("FAST_MODE_BLOCK_URLS")
+        return cls(
+            resource_types=DEFAULT_BLOCKED_RESOURCE_TYPES if types is None else [t.strip() for t in types.split(",") if t.strip()],
+            url_patterns=DEFAULT_BLOCKED_URL_PATTERNS if patterns is None else [p.strip() for p in patterns.split(",") if p.strip()],
+        )
+
+    @property
+    def blocking(self) -> bool:
+        return bool(self.resource_types) or self.url_pattern is not None
+
+    async def attach(self, context: BrowserContext) -> ResourceStats:
+        """Starts blocking in `context` (a fresh pooled one) and returns its live stats."""
+        playwright_context = (await context.get_session()).context
+        stats = ResourceStats()
+
+        async def handle(route):
+            request = route.request
+            if request.resource_type in self.resource_types:
+                reason = request.resource_type
+            elif self.url_pattern is not None and self.url_pattern.search(request.url):
+                reason = "url"
+            else:
+                reason = None
+            try:
+                if reason is None:
+                    await route.continue_()
+                else:
+                    stats.blocked[reason] += 1
+                    await route.abort("blockedbyclient")
+            except Exception:
+                pass # Page closed while the request was pending
+
+        if self.blocking:
+            await playwright_context.route("**/*", handle)
+        playwright_context.on("requestfinished", stats.on_request_finished)
+        return stats
+
+
+# --- LLM Response Cache / Replay ---
+class LLMReplayMissError(RuntimeError):
+    """Raised in replay mode when a prompt has no recorded response."""
+
+
+# browser_use adds "Current date and time: YYYY-MM-DD HH:MM" to each state message
+_PROMPT_TIMESTAMP = re.compile(r"(Current date and time: )\d{4}-\d{2}-\d{2} \d{2}:\d{2}")
+
+
+class LLMResponseCache(BaseCache):
+    """Persistent LangChain cache for chat model responses, with record/replay modes.
+
+    Entries are keyed on the serialized message list plus the model parameters
+    (LangChain's llm_string, which includes model, temperature and bound tools).
+    The clock time browser_use stamps into every state message is masked before
+    hashing, so a recording keeps matching in later runs.
+
+    - "record": serve recorded responses, call the API on a miss and record the answer.
+    - "replay": serve recorded responses only; a miss raises LLMReplayMissError, so
+      runs are deterministic and never touch the network.
+
+    Otherwise replay only matches when the agent sees the same pages again (e.g. local
+    fixtures), since page state and screenshots are part of the prompt.
+    """
+    MODES = ("record", "replay")
+
+    def __init__(self, path: str, mode: str = "record"):
+        if mode not in self.MODES:
+            raise ValueError(f"LLM cache mode must be one of {self.MODES}, got {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_responses (key TEXT PRIMARY KEY, llm_string TEXT, response TEXT, created_at REAL)"
         )
-        self.browser_config = BrowserConfig(
-            chrome_instance_path="C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe",
+        self._conn.commit()
+
+    @staticmethod
+    def _key(prompt: str, llm_string: str) -> str:
+        prompt = _PROMPT_TIMESTAMP.sub(r"\1<time>", prompt)
+        return hashlib.sha256(f"{llm_string}\n{prompt}".encode("utf-8")).hexdigest()
+
+    def lookup(self, prompt: str, llm_string: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response FROM llm_responses WHERE key = ?", (self._key(prompt, llm_string),)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if row is None:
+            if self.mode == "replay":
+                raise LLMReplayMissError("No recorded LLM response for this prompt (replay mode).")
+            return None
+        return [loads(generation) for generation in json.loads(row[0])]
+
+    def update(self, prompt: str, llm_string: str, return_val) -> None:
+        if self.mode == "replay":
+            return
+        response = json.dumps([dumps(generation) for generation in return_val])
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_responses (key, llm_string, response, created_at) VALUES (?, ?, ?, ?)",
+                (self._key(prompt, llm_string), llm_string, response, time.time()),
+            )
+            self._conn.commit()
+
+    def clear(self, **kwargs) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_responses")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        return {"mode": self.mode, "hits": self.hits, "misses": self.misses}
+
+
+# --- Task Timeline ---
+# Timeline of the task running in the current asyncio context (see TimelineCallbackHandler)
+_active_timeline = contextvars.ContextVar("active_timeline", default=None)
+
+
+class Timeline:
+    """Structured record of where a task's wall time went.
+
+    Each span has a name, a start offset and duration in seconds from the start of
+    the task, and free-form args (tokens, step number, actions...). Spans can be
+    exported as JSON or in Chrome trace format (chrome://tracing, Perfetto).
+    """
+    def __init__(self, name: str = "task"):
+        self.name = name
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def now(self) -> float:
+        """Seconds since the timeline started."""
+        return time.perf_counter() - self._t0
+
+    @contextlib.contextmanager
+    def span(self, name: str, **args):
+        """Times the enclosed block; the yielded dict can be filled with extra args."""
+        start = self.now()
+        try:
+            yield args
+        finally:
+            self.add(name, start, self.now() - start, **args)
+
+    def add(self, name: str, start: float, duration: float, **args):
+        with self._lock:
+            self.spans.append({"name": name, "start": round(start, 6), "duration": round(duration, 6), "args": args})
+
+    def totals(self) -> dict:
+        """Count and total seconds per span name, plus LLM token usage."""
+        totals = {}
+        tokens = {"input": 0, "output": 0}
+        with self._lock:
+            spans = list(self.spans)
+        for span in spans:
+            entry = totals.setdefault(span["name"], {"count": 0, "total_s": 0.0})
+            entry["count"] += 1
+            entry["total_s"] = round(entry["total_s"] + span["duration"], 6)
+            tokens["input"] += span["args"].get("input_tokens", 0)
+            tokens["output"] += span["args"].get("output_tokens", 0)
+        return {"spans": totals, "tokens": tokens}
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_s": round(self.now(), 6),
+            "spans": spans,
+            "totals": self.totals(),
+        }
+
+    def to_chrome_trace(self, pid: int = 1, tid: int = 1) -> dict:
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: (span["start"], -span["duration"]))
+        events = [{
+            "name": span["name"],
+            "cat": span["name"].split(".")[0],
+            "ph": "X",
+            "ts": int(span["start"] * 1e6),
+            "dur": max(1, int(span["duration"] * 1e6)),
+            "pid": pid,
+            "tid": tid,
+            "args": span["args"],
+        } for span in spans]
+        return {"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"task": self.name, "started_at": self.started_at}}
+
+    def write_chrome_trace(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_chrome_trace(), f, default=str)
+
+    def summary(self) -> str:
+        """Short human-readable breakdown for the GUI and console."""
+        totals = self.totals()
+        lines = [f"Total: {self.now():.2f} s | tokens in/out: {totals['tokens']['input']}/{totals['tokens']['output']}"]
+        for name, entry in sorted(totals["spans"].items(), key=lambda item: -item[1]["total_s"]):
+            if name == "task":
+                continue
+            average = entry["total_s"] / entry["count"]
+            lines.append(f"{name:<18} x{entry['count']:<3} {entry['total_s']:8.2f} s  (avg {average:.2f} s)")
+        return "\n".join(lines)
+
+
+class TimelineCallbackHandler(BaseCallbackHandler):
+    """Records every LLM call, with token usage, on the calling task's Timeline."""
+    run_inline = True # Run in the caller's context so _active_timeline resolves to its task
+
+    def __init__(self):
+        super().__init__()
+        self._starts = {} # run id -> (timeline, start offset)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        timeline = _active_timeline.get()
+        if timeline is not None:
+            params = kwargs.get("invocation_params") or {}
+            model = (kwargs.get("metadata") or {}).get("ls_model_name") or params.get("model_name") or params.get("model")
+            self._starts[run_id] = (timeline, timeline.now(), model)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        started = self._starts.pop(run_id, None)
+        if started is None:
+            return
+        timeline, start, model = started
+        input_tokens, output_tokens = 0, 0
+        try:
+            usage = response.generations[0][0].message.usage_metadata or {}
+            input_tokens, output_tokens = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+        except (AttributeError, IndexError):
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            input_tokens, output_tokens = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+        timeline.add("llm.call", start, timeline.now() - start, model=model, input_tokens=input_tokens, output_tokens=output_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        started = self._starts.pop(run_id, None)
+        if started is not None:
+            timeline, start, model = started
+            timeline.add("llm.call", start, timeline.now() - start, model=model, error=type(error).__name__)
+
+
+# --- Context Budget ---
+_HISTORY_START_MARKER = "[Your task history memory starts here]" # Last of browser_use's setup messages
+_STATE_MARKER = "[Current state starts here]" # Page-state message of the current step
+
+
+def _message_text(message) -> str:
+    if isinstance(message.content, str):
+        return message.content
+    return "".join(part.get("text", "") for part in message.content if isinstance(part, dict))
+
+
+def _shorten(text: str, limit: int) -> str:
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return text[:limit] + f" ... [{len(text) - limit} characters omitted]"
+
+
+def _estimate_tokens(messages: list) -> int:
+    """Rough prompt size, estimated the way browser_use does (3 characters per token, 800 per image)."""
+    tokens = 0
+    for message in messages:
+        tokens += len(_message_text(message)) // 3
+        if isinstance(message.content, list):
+            tokens += 800 * sum(1 for part in message.content if isinstance(part, dict) and "image_url" in part)
+    return tokens
+
+
+class ContextBudget:
+    """Limits on what each agent step sends to the LLM.
+
+    browser_use resends the whole conversation on every step, so prompts grow with
+    the step count. Before each LLM call the budget keeps browser_use's setup
+    messages and the last `keep_recent_steps` steps, folds older steps into a
+    one-line-per-step summary, shortens earlier action results to `max_result_chars`
+    and caps the page-state message at `max_state_chars` (0 disables each limit).
+    Results of `extract_content` steps are never shortened or folded away, since the
+    final answer is usually built from them.
+    `use_vision`, `include_attributes` and `viewport_expansion` control how large the
+    page state is in the first place. The agent's own history is left untouched.
+    """
+    def __init__(self, keep_recent_steps: int = 6, max_result_chars: int = 3000, max_state_chars: int = 60000,
+                 max_input_tokens: int = 128000, use_vision: bool = True, viewport_expansion: int = None,
+                 include_attributes: list = None):
+        self.keep_recent_steps = max(0, keep_recent_steps)
+        self.max_result_chars = max(0, max_result_chars)
+        self.max_state_chars = max(0, max_state_chars)
+        self.max_input_tokens = max_input_tokens
+        self.use_vision = use_vision
+        self.viewport_expansion = viewport_expansion # None keeps browser_use's default (500 px)
+        self.include_attributes = include_attributes # None keeps browser_use's default list
+
+    @classmethod
+    def from_env(cls) -> "ContextBudget":
+        attributes = os.getenv("CONTEXT_INCLUDE_ATTRIBUTES")
+        return cls(
+            keep_recent_steps=_env_int("CONTEXT_KEEP_STEPS", 6),
+            max_result_chars=_env_int("CONTEXT_MAX_RESULT_CHARS", 3000),
+            max_state_chars=_env_int("CONTEXT_MAX_STATE_CHARS", 60000),
+            max_input_tokens=_env_int("CONTEXT_MAX_INPUT_TOKENS", 128000),
+            use_vision=_env_bool("CONTEXT_USE_VISION", True),
+            viewport_expansion=_env_int("CONTEXT_VIEWPORT_EXPANSION", 500) if os.getenv("CONTEXT_VIEWPORT_EXPANSION") else None,
+            include_attributes=[name.strip() for name in attributes.split(",") if name.strip()] if attributes else None,
         )
+
+    def agent_kwargs(self) -> dict:
+        """Agent constructor arguments that bound the prompt size."""
+        kwargs = {"max_input_tokens": self.max_input_tokens, "use_vision": self.use_vision}
+        if self.include_attributes is not None:
+            kwargs["include_attributes"] = self.include_attributes
+        return kwargs
+
+    def apply(self, messages: list) -> list:
+        """Returns the messages to send for this step; the input list is not modified."""
+        history_start = next((i + 1 for i, m in enumerate(messages) if _message_text(m) == _HISTORY_START_MARKER), None)
+        state_index = next((i for i in range(len(messages) - 1, -1, -1)
+                            if isinstance(messages[i], HumanMessage) and _STATE_MARKER in _message_text(messages[i])), None)
+        if history_start is None or state_index is None or history_start > state_index:
+            return list(messages)
+
+        # Group the history into steps: the model's tool call, its tool message and any action results
+        prefix, steps = [], []
+        for message in messages[history_start:state_index]:
+            if isinstance(message, AIMessage) and message.tool_calls:
+                steps.append([message])
+            elif steps:
+                steps[-1].append(message)
+            else:
+                prefix.append(message)
+
+        trimmed = list(messages[:history_start]) + prefix
+        if self.keep_recent_steps and len(steps) > self.keep_recent_steps:
+            folded, steps = steps[:-self.keep_recent_steps], steps[-self.keep_recent_steps:]
+            trimmed.append(HumanMessage(content=self._summarize(folded)))
+            # Extracted page content survives folding as it was
+            trimmed.extend(message for step in folded if self._is_extraction(step)
+                           for message in step[1:] if isinstance(message, HumanMessage))
+        for index, step in enumerate(steps):
+            keep_results = index == len(steps) - 1 or self._is_extraction(step) # Newest step and extractions stay complete
+            for message in step:
+                text = _message_text(message)
+                if not keep_results and isinstance(message, HumanMessage) and len(text) > self.max_result_chars > 0:
+                    message = HumanMessage(content=_shorten(text, self.max_result_chars))
+                trimmed.append(message)
+        trimmed.append(self._cap_state(messages[state_index]))
+        trimmed.extend(messages[state_index + 1:])
+        return trimmed
+
+    @staticmethod
+    def _is_extraction(step: list) -> bool:
+        args = (step[0].tool_calls[0].get("args") or {}) if step[0].tool_calls else {}
+        return any(isinstance(action, dict) and "extract_content" in action for action in args.get("action", []))
+
+    def _summarize(self, steps: list) -> str:
+        lines = [f"[Summary of {len(steps)} earlier steps; details omitted to save context]"]
+        for step in steps:
+            args = (step[0].tool_calls[0].get("args") or {}) if step[0].tool_calls else {}
+            current_state = args.get("current_state") or {}
+            actions = ", ".join(next(iter(action), "unknown") for action in args.get("action", []) if isinstance(action, dict))
+            line = f"- goal: {current_state.get('next_goal', '')} | actions: {actions or 'none'}"
+            results = [_message_text(m) for m in step[1:] if isinstance(m, HumanMessage) and _message_text(m).startswith("Action result: ")]
+            if self._is_extraction(step):
+                line += " | extracted content kept below"
+            elif results:
+                line += f" | {_shorten(results[-1], 200)}"
+            lines.append(line)
+        return "\n".join(lines)
+
+    def _cap_state(self, message):
+        if not self.max_state_chars:
+            return message
+        if isinstance(message.content, str):
+            if len(message.content) <= self.max_state_chars:
+                return message
+            return HumanMessage(content=self._cap_text(message.content))
+        parts = [dict(part, text=self._cap_text(part["text"])) if isinstance(part, dict) and "text" in part else part
+                 for part in message.content]
+        return HumanMessage(content=parts)
+
+    def _cap_text(self, text: str) -> str:
+        """Keeps the top of the page state (url, tabs, first elements) and its tail (step info, results)."""
+        if len(text) <= self.max_state_chars:
+            return text
+        tail = min(2000, self.max_state_chars // 4)
+        head = self.max_state_chars - tail
+        return f"{text[:head]}\n... [page state truncated: {len(text) - head - tail} characters omitted] ...\n{text[-tail:]}"
+
+
+# --- Model Routing ---
+def _model_name(llm) -> str:
+    return getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+
+
+class ModelRouter:
+    """Runs each task on `fast_llm` and switches it to `strong_llm` once the task looks hard.
+
+    A task escalates, for the rest of its run, when a step fails, the model judges its
+    previous goal as failed, the fast model gives up (done with success=false), or it
+    has taken `fast_max_steps` steps without finishing. Page extraction always uses
+    the fast model.
+    """
+    def __init__(self, strong_llm, fast_llm, fast_max_steps: int = 10):
+        self.strong_llm = strong_llm
+        self.fast_llm = fast_llm
+        self.fast_max_steps = max(1, fast_max_steps)
+
+    def escalation_reason(self, agent) -> str:
+        """Why the agent should switch to the strong model before its next step, or None."""
+        if agent.state.consecutive_failures > 0:
+            return "last step failed"
+        history = agent.state.history.history
+        last_output = history[-1].model_output if history else None
+        if last_output is not None and last_output.current_state.evaluation_previous_goal.strip().lower().startswith("failed"):
+            return "model reported its previous goal as failed"
+        if agent.state.n_steps > self.fast_max_steps:
+            return f"still unfinished after {self.fast_max_steps} steps"
+        return None
+
+
+class ModelStats:
+    """Per-model LLM call latency and task success, accumulated over the runner's lifetime."""
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def record(self, timeline: Timeline, final_model: str, success: bool):
+        """Adds a finished task's LLM calls; the task's outcome counts for the model that finished it."""
+        calls = [span for span in timeline.to_dict()["spans"] if span["name"] == "llm.call"]
+        with self._lock:
+            for span in calls:
+                entry = self._entry(span["args"].get("model") or "unknown")
+                entry["calls"] += 1
+                entry["errors"] += 1 if "error" in span["args"] else 0
+                entry["latency_s"] += span["duration"]
+                entry["input_tokens"] += span["args"].get("input_tokens", 0)
+                entry["output_tokens"] += span["args"].get("output_tokens", 0)
+            if final_model:
+                entry = self._entry(final_model)
+                entry["tasks"] += 1
+                entry["successes"] += 1 if success else 0
+
+    def _entry(self, model: str) -> dict:
+        return self._models.setdefault(model, {"calls": 0, "errors": 0, "latency_s": 0.0, "input_tokens": 0,
+                                               "output_tokens": 0, "tasks": 0, "successes": 0})
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            models = {model: dict(entry) for model, entry in self._models.items()}
+        for entry in models.values():
+            entry["avg_latency_s"] = round(entry["latency_s"] / entry["calls"], 3) if entry["calls"] else None
+            entry["success_rate"] = round(entry["successes"] / entry["tasks"], 3) if entry["tasks"] else None
+            entry["latency_s"] = round(entry["latency_s"], 3)
+        return models
+
+    def summary(self) -> str:
+        parts = []
+        for model, entry in sorted(self.snapshot().items()):
+            latency = f"avg {entry['avg_latency_s']:.2f} s" if entry["avg_latency_s"] is not None else "no calls"
+            parts.append(f"{model}: {entry['calls']} calls, {latency}, {entry['successes']}/{entry['tasks']} tasks ok")
+        return " | ".join(parts)
+
+
+def _step_event(step_number: int, item) -> dict:
+    """JSON-friendly summary of one finished agent step (an AgentHistory entry)."""
+    output = item.model_output
+    extracted = [r.extracted_content for r in item.result if r.extracted_content]
+    return {
+        "type": "step",
+        "step": step_number,
+        "url": item.state.url if item.state else None,
+        "next_goal": output.current_state.next_goal if output else None,
+        "actions": [action.model_dump(exclude_unset=True) for action in output.action] if output else [],
+        "extracted_content": extracted,
+        "errors": [r.error for r in item.result if r.error],
+        "is_done": any(r.is_done for r in item.result),
+        "partial_result": extracted[-1] if extracted else None,
+    }
+
+
+def _emit(on_event, event: dict):
+    """Delivers a task event; a failing consumer must not break the task."""
+    if on_event is None:
+        return
+    try:
+        on_event(event)
+    except Exception as e:
+        print(f"Error delivering task event: {e}")
+
+
+def _with_partial_result(message: str, agent) -> str:
+    """Appends the last content the agent extracted, so a stopped task still returns what it found."""
+    if agent is not None:
+        for item in reversed(agent.state.history.history):
+            for action_result in reversed(item.result):
+                if action_result.extracted_content:
+                    return f"{message}\n\nLast result before stopping:\n{action_result.extracted_content}"
+    return message
+
+
+class InstrumentedAgent(Agent):
+    """Agent that records each step and each batch of browser actions on a Timeline.
+
+    If `on_step` is given it is called with a step event (see `_step_event`) as soon
+    as each step finishes, so callers can show progress before `run()` returns.
+    """
+    def __init__(self, *args, timeline: Timeline = None, on_step=None, context_budget: ContextBudget = None,
+                 router: ModelRouter = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.timeline = timeline or Timeline()
+        self.on_step = on_step
+        self.context_budget = context_budget
+        self.router = router
+        self.escalation_reason = None # Set once the task has switched to the strong model
+        self.on_last_step = False # True during the forced final step at max_steps
+
+    def _escalate(self, reason: str):
+        from_model, to_model = _model_name(self.llm), _model_name(self.router.strong_llm)
+        self.llm = self.router.strong_llm # get_next_action reads self.llm on every call
+        self.escalation_reason = reason
+        self.timeline.add("model.escalate", self.timeline.now(), 0.0, from_model=from_model, to_model=to_model, reason=reason)
+        log_queue = _active_log_queue.get()
+        if log_queue is not None:
+            log_queue.put(f"WARNING  [system] Switching from {from_model} to {to_model}: {reason}.")
+
+    async def get_next_action(self, input_messages):
+        if self.context_budget is not None:
+            with self.timeline.span("context.trim", tokens_before=_estimate_tokens(input_messages)) as args:
+                input_messages = self.context_budget.apply(input_messages)
+                args["tokens_after"] = _estimate_tokens(input_messages)
+        return await super().get_next_action(input_messages)
+
+    async def step(self, step_info=None):
+        if self.router is not None and self.escalation_reason is None:
+            reason = self.router.escalation_reason(self)
+            if reason:
+                self._escalate(reason)
+        step_number = self.state.n_steps
+        history_length = len(self.state.history.history)
+        self.on_last_step = step_info is not None and step_info.is_last_step()
+        with self.timeline.span("agent.step", step=step_number):
+            await super().step(step_info)
+        if len(self.state.history.history) > history_length:
+            _emit(self.on_step, _step_event(step_number, self.state.history.history[-1]))
+
+    async def multi_act(self, actions, check_for_new_elements: bool = True):
+        # On the last step there's no later step for the strong model, so the fast model's answer stands
+        if self.router is not None and self.escalation_reason is None and not self.on_last_step:
+            for action in actions:
+                done = action.model_dump(exclude_unset=True).get("done")
+                if done is not None and done.get("success") is False:
+                    # The fast model gave up; let the strong model continue instead of finishing
+                    self._escalate("fast model could not complete the task")
+                    return [ActionResult(extracted_content=f"Not finished yet: {done.get('text', '')}", include_in_memory=True)]
+        action_names = [next(iter(action.model_dump(exclude_unset=True)), "unknown") for action in actions]
+        with self.timeline.span("browser.actions", actions=action_names):
+            return await super().multi_act(actions, check_for_new_elements)
+
+
+class SimpleAgentRunner:
+
+    def __init__(self, max_concurrency: int = None, llm=None, browser_config: BrowserConfig = None, pool_size: int = None, fast_llm=None):
+        """All arguments are optional; unset ones come from .env. Passing `llm` (e.g. a stub
+        model for offline benchmarks) bypasses the OpenAI client and its rate limit/cache;
+        `fast_llm` then enables model routing with that model."""
+        # Agents allowed to run at once; each needs its own pooled browser
+        self.max_concurrency = max(1, max_concurrency or _env_int("AGENT_MAX_CONCURRENCY", 1))
+        self.llm_cache = None
+        self._rate_limiter = None
+        if llm is not None:
+            self.llm = llm
+        else:
+            self.llm = self._create_openai_llm(os.getenv("LLM_MODEL", "gpt-4o"))
+            fast_model = os.getenv("LLM_FAST_MODEL", "").strip()
+            fast_llm = self._create_openai_llm(fast_model) if fast_model else None
+        # Optional routing: tasks start on the fast model and escalate to self.llm when they struggle
+        self.router = ModelRouter(self.llm, fast_llm, fast_max_steps=_env_int("LLM_FAST_MAX_STEPS", 10)) if fast_llm is not None else None
+        self.model_stats = ModelStats()
+        # Directory for per-task Chrome trace files (unset = don't write traces)
+        self.trace_dir = os.getenv("TRACE_DIR")
+        pool_size = pool_size or _env_int("BROWSER_POOL_SIZE", self.max_concurrency)
+        if browser_config is not None:
+            self.browser_config = copy.deepcopy(browser_config) # Adjusted below; the caller's config stays as given
+        elif pool_size > 1:
+            # Concurrent tasks need a browser each, and every browser would attach to the one
+            # Chrome on the debugging port; launch Playwright's Chromium with isolated contexts instead
+            self.browser_config = BrowserConfig()
+        else:
+            self.browser_config = BrowserConfig(
+                chrome_instance_path="C:\\Program Files\\Google\\Chrome\\Application\\chrome.exe",
+            )
+        # Optional fast mode for extraction tasks: skip images, fonts, media, ads and trackers
+        self.resource_blocker = ResourceBlocker.from_env() if _env_bool("FAST_MODE", False) else None
+        # Caps on prompt size per step (history, page state, screenshots)
+        self.context_budget = ContextBudget.from_env()
+        if self.context_budget.viewport_expansion is not None:
+            self.browser_config.new_context_config.viewport_expansion = self.context_budget.viewport_expansion
         # Ensure the loggers exist and set level - do this once
         for name in LOGGER_NAMES:
             logging.getLogger(name).setLevel(logging.INFO)
         # Set root level minimally to allow INFO from library to pass through if needed
         logging.getLogger().setLevel(logging.INFO)
+        # Per-task limits: agent steps, and wall-clock seconds for the agent run (0 = no limit)
+        self.max_steps = max(1, _env_int("AGENT_MAX_STEPS", 100))
+        self.task_timeout = max(0.0, _env_float("TASK_TIMEOUT_SECONDS", 0.0))
+        # Opt-in result cache for repeated commands (RESULT_CACHE_PATH unset = disabled)
+        self.result_cache = None
+        cache_path = os.getenv("RESULT_CACHE_PATH")
+        if cache_path:
+            self.result_cache = ResultCache(
+                cache_path,
+                ttl_seconds=_env_float("RESULT_CACHE_TTL", 3600.0),
+                max_entries=_env_int("RESULT_CACHE_MAX_ENTRIES", 1000),
+            )
+        # Opt-in saved logins (SESSION_STORE_PATH unset = every task starts logged out)
+        self.session_store = None
+        session_path = os.getenv("SESSION_STORE_PATH")
+        if session_path:
+            self.session_store = SessionStore(
+                session_path,
+                name=os.getenv("SESSION_NAME", "default"),
+                auth_url_pattern=os.getenv("SESSION_AUTH_URL_PATTERN") or DEFAULT_AUTH_URL_PATTERN,
+            )
+        if _is_shared_browser(self.browser_config) and (self.session_store is not None or self.resource_blocker is not None):
+            # Both install state on the task's context, which a shared Chrome would keep for every later task
+            print("SESSION_STORE_PATH and FAST_MODE need a fresh browser context per task; "
+                  "they are ignored while attached to a running Chrome (chrome_instance_path).")
+            self.session_store = None
+            self.resource_blocker = None
+        if self.resource_blocker is not None and _env_bool("FAST_MODE_HEADLESS", False):
+            self.browser_config.headless = True
+        # Warm browsers shared by all tasks; bound to the runner's own event loop
+        self.browser_pool = BrowserPool(
+            self.browser_config,
+            size=pool_size,
+            max_uses=_env_int("BROWSER_MAX_USES", 20),
+            max_memory_mb=_env_int("BROWSER_MAX_MEMORY_MB", 0),
+            close_timeout=_env_float("BROWSER_CLOSE_TIMEOUT", 10.0),
+        )
+        # Long-lived event loop thread; started on first use and shared by every task
+        self._loop_tasks = {} # concurrent future -> asyncio task running it (touched on the loop thread only)
+        self._loop = None
+        self._loop_thread = None
+        self._loop_lock = threading.Lock()
+
+    def _create_openai_llm(self, model: str) -> ChatOpenAI:
+        # Global LLM request rate shared by all concurrent tasks and models (0 = unlimited)
+        requests_per_second = _env_float("LLM_REQUESTS_PER_SECOND", 0.0)
+        if requests_per_second > 0 and self._rate_limiter is None:
+            self._rate_limiter = InMemoryRateLimiter(
+                requests_per_second=requests_per_second,
+                check_every_n_seconds=0.05,
+                max_bucket_size=self.max_concurrency,
+            )
+        # Optional LLM response cache: LLM_CACHE_MODE=record|replay (unset = off)
+        llm_cache_mode = os.getenv("LLM_CACHE_MODE", "").strip().lower()
+        if llm_cache_mode and llm_cache_mode != "off" and self.llm_cache is None:
+            self.llm_cache = LLMResponseCache(os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite"), mode=llm_cache_mode)
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key and llm_cache_mode == "replay":
+            api_key = "replay-only" # Replay never reaches the API, but the client requires a key
+        return ChatOpenAI(
+            model=model,
+            temperature=0.0,
+            api_key=api_key,
+            rate_limiter=self._rate_limiter,
+            cache=self.llm_cache,
+            callbacks=[TimelineCallbackHandler()],
+        )
+
+    # --- Result Caching ---
+    def _cache_config(self) -> dict:
+        """Runner settings that change the answer for a given command."""
+        return {
+            "model": getattr(self.llm, "model_name", None),
+            "fast_model": _model_name(self.router.fast_llm) if self.router else None,
+            "temperature": getattr(self.llm, "temperature", None),
+            "fast_mode": self.resource_blocker is not None and self.resource_blocker.blocking,
+        }
+
+    def _cached_result(self, user_command: str, log_queue: queue.Queue, on_event=None):
+        """Returns a stored result for this command, or None if caching is off or it's a miss."""
+        if self.result_cache is None:
+            return None
+        result = self.result_cache.get(self.result_cache.make_key(user_command, self._cache_config()))
+        if result is None:
+            return None
+        stats = self.result_cache.stats()
+        log_queue.put(f"INFO     [system] Result served from cache (hits={stats['hits']}, misses={stats['misses']}).")
+        log_queue.put("--- AGENT TASK FINISHED (CACHED) ---")
+        result["cached"] = True
+        _emit(on_event, {"type": "finished", "success": result.get("success", False), "final_output": result.get("final_output"), "cached": True})
+        return result
 
+    async def _execute_async(self, user_command: str, log_queue: queue.Queue, on_event=None) -> dict:
+        cached = self._cached_result(user_command, log_queue, on_event)
+        if cached is not None:
+            return cached
+        return await self._execute_uncached(user_command, log_queue, on_event)
 
-    async def _execute_async(self, user_command: str, log_queue: queue.Queue) -> dict:
+    async def _execute_uncached(self, user_command: str, log_queue: queue.Queue, on_event=None) -> dict:
+        """Runs one task on a pooled browser. `on_event` receives a "step" event after every
+        agent step and a "finished" event at the end; it is called on the runner's loop thread."""
         log_handler = QueueHandler(log_queue)
         loggers_with_handler = [] # Keep track of which loggers we added the handler to
 
-        browser = None
+        pooled = None
+        agent = None
+        sessions = None
+        resources = None
         final_output = "Task initiated."
         chat_response = "Processing..."
+        success = False
+        cancelled = False
+        timeline = Timeline(user_command)
+        _active_log_queue.set(log_queue) # Scoped to this task's asyncio context
+        _active_timeline.set(timeline)
 
         try:
             # Initial status message
             log_queue.put("INFO     [system] Agent process starting...")
 
-            # Initialize browser_use components
-            browser = Browser(config=self.browser_config)
-            controller = Controller()
-            agent = Agent(
-                task=user_command,
-                llm=self.llm,
-                browser=browser,
-                controller=controller,
-            )
+            # Check out a warm browser; the agent gets a fresh context on it
+            with timeline.span("browser.checkout"):
+                pooled = await self.browser_pool.acquire()
+            log_queue.put(f"INFO     [system] Using warm browser (use {pooled.uses}/{self.browser_pool.max_uses}).")
+            if self.session_store is not None:
+                with timeline.span("session.restore"):
+                    sessions = await self.session_store.restore(pooled.context)
+                if sessions.sites:
+                    log_queue.put(f"INFO     [system] Restored saved sessions for: {', '.join(sorted(sessions.sites))}.")
+            if self.resource_blocker is not None:
+                resources = await self.resource_blocker.attach(pooled.context)
+            with timeline.span("agent.init"):
+                controller = Controller()
+                routing = {"page_extraction_llm": self.router.fast_llm} if self.router else {}
+                agent = InstrumentedAgent(
+                    task=user_command,
+                    llm=self.router.fast_llm if self.router else self.llm,
+                    browser=pooled.browser,
+                    browser_context=pooled.context,
+                    controller=controller,
+                    timeline=timeline,
+                    on_step=on_event,
+                    context_budget=self.context_budget,
+                    router=self.router,
+                    **routing,
+                    **self.context_budget.agent_kwargs(),
+                )
 
             # --- Add QueueHandler just before running ---
             log_queue.put("INFO     [system] Attaching log handler...")
@@ -79,10 +1482,46 @@ class SimpleAgentRunner:
                     logger.setLevel(logging.INFO) # Ensure level again just in case
 
             # --- Run the agent ---
-            result = await agent.run()
-            final_output = result.final_result()
-            chat_response = "Task completed."
-            log_queue.put("--- AGENT TASK FINISHED ---")
+            with timeline.span("agent.run"):
+                result = await asyncio.wait_for(agent.run(max_steps=self.max_steps), self.task_timeout or None)
+            if result.is_done():
+                final_output = result.final_result()
+                success = bool(result.is_successful()) # The agent may finish with done(success=False)
+                if success:
+                    chat_response = "Task completed."
+                    log_queue.put("--- AGENT TASK FINISHED ---")
+                else:
+                    chat_response = "Sorry, the agent could not complete the task."
+                    log_queue.put("WARNING  [system] Agent finished without completing the task.")
+                    log_queue.put("--- AGENT TASK FAILED ---")
+            elif agent.state.consecutive_failures >= agent.settings.max_failures:
+                failures = agent.state.consecutive_failures
+                final_output = _with_partial_result(f"Agent stopped after {failures} consecutive failures.", agent)
+                errors = [error for error in result.errors() if error]
+                if errors:
+                    final_output += f"\n\nLast error:\n{errors[-1].strip()}"
+                chat_response = "Sorry, the task kept failing and was stopped."
+                log_queue.put(f"WARNING  [system] Stopped after {failures} consecutive failures.")
+                log_queue.put("--- AGENT TASK FAILED ---")
+            else:
+                final_output = _with_partial_result(f"Agent stopped after reaching the {self.max_steps} step limit.", agent)
+                chat_response = "Sorry, the task hit its step limit before finishing."
+                log_queue.put(f"WARNING  [system] Step limit ({self.max_steps}) reached.")
+                log_queue.put("--- AGENT TASK FAILED ---")
+
+        except asyncio.TimeoutError:
+            final_output = _with_partial_result(f"Agent stopped after exceeding the {self.task_timeout:g} s time limit.", agent)
+            chat_response = "Sorry, the task ran out of time."
+            log_queue.put(f"WARNING  [system] Time limit ({self.task_timeout:g} s) exceeded, agent stopped.")
+            log_queue.put("--- AGENT TASK FAILED ---")
+
+        except asyncio.CancelledError:
+            # Cancelled via cancel(); finish cleanup and report instead of propagating
+            cancelled = True
+            final_output = _with_partial_result("Task cancelled.", agent)
+            chat_response = "Task cancelled."
+            log_queue.put("WARNING  [system] Task cancelled.")
+            log_queue.put("--- AGENT TASK CANCELLED ---")
 
         except Exception as e:
             print(f"Error during agent execution: {e}\n{traceback.format_exc()}")
@@ -94,33 +1533,214 @@ class SimpleAgentRunner:
             log_queue.put("--- AGENT TASK FAILED ---")
 
         finally:
+            cleanup_start = timeline.now()
             # --- Remove QueueHandler ---
             log_queue.put("INFO     [system] Detaching log handler...")
             for logger in loggers_with_handler:
                  logger.removeHandler(log_handler)
 
-            # --- Cleanup Browser ---
-            if browser:
-                try:
-                    await browser.close()
-                    log_queue.put("INFO     [system] Browser closed.")
-                except Exception as close_e:
-                    print(f"Error closing browser: {close_e}")
-                    log_queue.put(f"WARNING  [system] Failed to close browser: {close_e}")
+            if sessions is not None and agent is not None:
+                await self._save_sessions(pooled, sessions, agent, success, log_queue, timeline)
 
-        return {
+            # --- Return Browser to Pool ---
+            if pooled:
+                self.browser_pool.release(pooled)
+                log_queue.put("INFO     [system] Browser returned to pool.")
+            timeline.add("cleanup", cleanup_start, timeline.now() - cleanup_start)
+            timeline.add("task", 0.0, timeline.now())
+
+        result_dict = {
             "chat_response": chat_response,
             "final_output": str(final_output),
+            "success": success,
         }
+        if cancelled:
+            result_dict["cancelled"] = True
+        _emit(on_event, {"type": "finished", "success": success, "final_output": result_dict["final_output"], "cached": False})
+        if success and self.result_cache is not None:
+            try:
+                self.result_cache.put(self.result_cache.make_key(user_command, self._cache_config()), user_command, result_dict)
+            except sqlite3.Error as e:
+                print(f"Error writing result cache: {e}")
 
-    def run_task(self, user_command: str, log_queue: queue.Queue) -> dict:
-        try:
+        # --- Timing Report ---
+        result_dict["timeline"] = timeline.to_dict()
+        result_dict["tokens"] = result_dict["timeline"]["totals"]["tokens"]
+        if resources is not None:
+            result_dict["resources"] = resources.to_dict()
+            log_queue.put(f"INFO     [system] Fast mode: {resources.summary()}")
+        if agent is not None:
+            result_dict["model"] = _model_name(agent.llm)
+            result_dict["escalation"] = agent.escalation_reason
+            self.model_stats.record(timeline, result_dict["model"], success)
+            if self.router is not None:
+                log_queue.put(f"INFO     [system] Model stats: {self.model_stats.summary()}")
+        result_dict["timing_summary"] = timeline.summary()
+        log_queue.put("INFO     [system] Timing:\n" + result_dict["timing_summary"])
+        if self.trace_dir:
+            trace_path = os.path.join(self.trace_dir, f"task-{int(timeline.started_at)}-{uuid.uuid4().hex[:8]}.json")
             try:
-                loop = asyncio.get_running_loop()
-            except RuntimeError:
+                timeline.write_chrome_trace(trace_path)
+                result_dict["trace_path"] = trace_path
+            except OSError as e:
+                print(f"Error writing trace file: {e}")
+        return result_dict
+
+    async def _save_sessions(self, pooled: PooledBrowser, sessions: SessionCheckout, agent: Agent, success: bool,
+                             log_queue: queue.Queue, timeline: Timeline):
+        """Snapshots the logins the task left in its context before the pool discards it."""
+        try:
+            with timeline.span("session.save"):
+                saved, invalidated = await asyncio.wait_for(
+                    self.session_store.update(pooled.context, sessions, agent.state.history.urls(), success),
+                    self.browser_pool.close_timeout,
+                )
+        except Exception as e:
+            log_queue.put(f"WARNING  [system] Could not save browser sessions: {type(e).__name__}: {e}")
+            return
+        for site in invalidated:
+            log_queue.put(f"WARNING  [system] Saved login for {site} no longer works; discarded it.")
+        if saved:
+            log_queue.put(f"INFO     [system] Saved browser sessions for: {', '.join(saved)}.")
+
+    # --- Background Event Loop ---
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """Starts the runner's event loop thread once and returns its loop."""
+        with self._loop_lock:
+            if self._loop is None:
                 loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-            result = loop.run_until_complete(self._execute_async(user_command, log_queue))
+                thread = threading.Thread(target=self._loop_main, args=(loop,), name="agent-loop", daemon=True)
+                thread.start()
+                self._loop, self._loop_thread = loop, thread
+            return self._loop
+
+    def _loop_main(self, loop: asyncio.AbstractEventLoop):
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
+
+    def _submit_coroutine(self, coro) -> concurrent.futures.Future:
+        """Schedules a coroutine on the runner's loop from any thread.
+
+        Stop it with `cancel(future)` rather than `future.cancel()`: that cancels the
+        coroutine on the loop, and the future then resolves with whatever it returns.
+        """
+        loop = self._ensure_loop()
+        future = concurrent.futures.Future()
+
+        def start():
+            if future.cancelled():
+                coro.close()
+                return
+            task = loop.create_task(coro)
+            self._loop_tasks[future] = task
+            task.add_done_callback(lambda done: self._resolve(future, done))
+
+        loop.call_soon_threadsafe(start)
+        return future
+
+    def _resolve(self, future: concurrent.futures.Future, task: asyncio.Task):
+        self._loop_tasks.pop(future, None)
+        try:
+            if task.cancelled():
+                future.cancel()
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result())
+        except concurrent.futures.InvalidStateError:
+            pass # The caller cancelled the future itself
+
+    def submit(self, user_command: str, log_queue: queue.Queue, on_event=None) -> concurrent.futures.Future:
+        """Schedules a task on the runner's loop; the future resolves to the result dict.
+
+        `on_event` (optional) is called from the loop thread with each step event as it happens.
+        """
+        return self._submit_coroutine(self._execute_async(user_command, log_queue, on_event))
+
+    def cancel(self, future: concurrent.futures.Future) -> bool:
+        """Stops a task started with `submit` (or a TaskScheduler task's future).
+
+        The task is cancelled on the runner's loop at its current await (LLM call or
+        browser action); its log handler is detached and its browser returned to the
+        pool straight away. The future then resolves with the cancelled result dict,
+        including any partial output. Returns False if the task had already finished.
+        """
+        loop = self._loop
+        if future.done() or loop is None:
+            return False
+        loop.call_soon_threadsafe(self._cancel_on_loop, future)
+        return True
+
+    def _cancel_on_loop(self, future: concurrent.futures.Future):
+        task = self._loop_tasks.get(future)
+        if task is not None:
+            task.cancel()
+
+    async def stream(self, user_command: str, log_queue: queue.Queue = None):
+        """Async generator yielding step events while the task runs, then a final
+        {"type": "result", ...} event carrying the full result dict.
+
+        Must be iterated on the runner's loop (e.g. inside a coroutine passed to
+        `_submit_coroutine`); other threads should use `submit(..., on_event=...)`.
+        """
+        events = asyncio.Queue()
+        job = asyncio.ensure_future(self._execute_async(user_command, log_queue or BoundedLogQueue(LOG_QUEUE_MAX_LINES), events.put_nowait))
+        try:
+            while not job.done():
+                getter = asyncio.ensure_future(events.get())
+                await asyncio.wait({getter, job}, return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield getter.result()
+                else:
+                    getter.cancel()
+            while not events.empty():
+                yield events.get_nowait()
+            yield {"type": "result", **job.result()}
+        finally:
+            if not job.done():
+                job.cancel()
+
+    def warm_up(self) -> concurrent.futures.Future:
+        """Launches the pooled browsers ahead of the first task without blocking the caller."""
+        future = self._submit_coroutine(self.browser_pool.start())
+        future.add_done_callback(self._report_warm_up)
+        return future
+
+    def _report_warm_up(self, future: concurrent.futures.Future):
+        if not future.cancelled() and future.exception() is not None:
+            print(f"Error warming up browser pool: {future.exception()}")
+
+    def close(self, timeout: float = 10.0):
+        """Closes the pooled browsers and stops the runner's event loop thread."""
+        with self._loop_lock:
+            loop, thread = self._loop, self._loop_thread
+            self._loop, self._loop_thread = None, None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(timeout / 2), loop).result(timeout)
+        except Exception as e:
+            print(f"Error closing browser pool: {e}")
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(timeout)
+            if not loop.is_running():
+                loop.close()
+
+    async def _shutdown(self, cancel_timeout: float):
+        """Cancels tasks still running on the loop so they release their browsers, then closes the pool."""
+        # Pool resets are left running; browser_pool.close() waits for them
+        resets = self.browser_pool.resets
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task() and task not in resets]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks, timeout=cancel_timeout)
+        await self.browser_pool.close()
+
+    def run_task(self, user_command: str, log_queue: queue.Queue) -> dict:
+        try:
+            result = self.submit(user_command, log_queue).result()
             return result
         except Exception as e:
              print(f"Error running async task: {e}\n{traceback.format_exc()}")
@@ -136,10 +1756,541 @@ class SimpleAgentRunner:
                  "final_output": f"Failed.\n{e}",
              }
 
-agent_runner_instance = SimpleAgentRunner()
+# --- Task Scheduler ---
+class ScheduledTask:
+    """Status, logs and result of one command submitted to a TaskScheduler."""
+    def __init__(self, task_id: int, command: str, keep_log_lines: int = 0):
+        self.id = task_id
+        self.command = command
+        self.status = "queued" # queued -> running -> completed | failed | cancelled
+        self.result = None
+        self.log_queue = BoundedLogQueue(LOG_QUEUE_MAX_LINES, keep_recent=keep_log_lines) # keep_log_lines: copy kept for the history store
+        self.events = [] # Step/finished events in order; append-only so several readers can follow it
+        self.future = None
+        self.history_id = None # Row in the TaskHistory store once recorded
+        self.cancel_requested = False
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
 
-# Keep the __main__ block for standalone testing if desired
-if __name__ == '__main__':
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed", "cancelled")
+
+
+def _record_history(history: TaskHistory, task: ScheduledTask):
+    if history is None:
+        return
+    try:
+        task.history_id = history.add(task)
+    except sqlite3.Error as e:
+        print(f"Error writing task history: {e}")
+
+
+def _cancelled_result() -> dict:
+    return {"chat_response": "Task cancelled.", "final_output": "Task cancelled.", "success": False, "cancelled": True}
+
+
+def _aborted_result() -> dict:
+    """Result of a task that ended without producing one (crash or shutdown)."""
+    return {"chat_response": "Task did not complete.", "final_output": "Task aborted.", "success": False}
+
+
+class _SchedulerBase:
+    """Task records shared by TaskScheduler and WorkerPoolScheduler; subclasses start
+    each submitted task in `_start`."""
+    def __init__(self, history: TaskHistory = None):
+        self.history = history
+        self._tasks = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, command: str) -> ScheduledTask:
+        """Queues a command and returns its task record immediately."""
+        with self._lock:
+            task = ScheduledTask(next(self._ids), command, keep_log_lines=self.history.max_log_lines if self.history else 0)
+            self._tasks[task.id] = task
+            self._start(task)
+        return task
+
+    def _start(self, task: ScheduledTask):
+        """Sets `task.future` and schedules the task; called with self._lock held."""
+        raise NotImplementedError
+
+    def get(self, task_id: int) -> ScheduledTask:
+        return self._tasks.get(task_id)
+
+    def list_tasks(self) -> list:
+        with self._lock:
+            return list(self._tasks.values())
+
+    def wait(self, task_id: int, timeout: float = None) -> dict:
+        """Blocks until the task finishes and returns its result dict."""
+        return self._tasks[task_id].future.result(timeout)
+
+    def discard(self, task_id: int):
+        """Forgets a finished task so long-running schedulers don't accumulate records."""
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is not None and task.finished:
+                del self._tasks[task_id]
+
+
+class TaskScheduler(_SchedulerBase):
+    """Accepts any number of commands and runs up to `max_concurrency` agents at once.
+
+    Tasks run on the runner's event loop, each with its own pooled browser and log
+    queue; LLM calls from all of them share the runner's global rate limiter.
+    Finished tasks are written to `history` (a TaskHistory) when one is given.
+    """
+    def __init__(self, runner: SimpleAgentRunner, max_concurrency: int = None, history: TaskHistory = None):
+        super().__init__(history)
+        self.runner = runner
+        self.max_concurrency = max(1, max_concurrency or runner.max_concurrency)
+        self._semaphore = None # Created on the runner's loop
+
+    def _start(self, task: ScheduledTask):
+        task.future = self.runner._submit_coroutine(self._run(task))
+
+    def cancel(self, task_id: int) -> bool:
+        """Stops a queued or running task; it ends with status "cancelled" once cleaned up."""
+        task = self._tasks.get(task_id)
+        if task is None or task.finished:
+            return False
+        task.cancel_requested = True
+        return self.runner.cancel(task.future)
+
+    def close(self, timeout: float = 10.0):
+        """Shuts down the runner: outstanding tasks are cancelled and the browsers closed."""
+        self.runner.close(timeout)
+        if self.history is not None:
+            self.history.close()
+
+    async def _run(self, task: ScheduledTask) -> dict:
+        result = None
+        try:
+            # Cache hits don't need a browser, so they skip the concurrency limit
+            result = self.runner._cached_result(task.command, task.log_queue, task.events.append)
+            if result is not None:
+                task.started_at = time.time()
+                return result
+            if self._semaphore is None:
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            async with self._semaphore:
+                task.status = "running"
+                task.started_at = time.time()
+                result = await self.runner._execute_uncached(task.command, task.log_queue, task.events.append)
+                return result
+        except asyncio.CancelledError:
+            if not task.cancel_requested:
+                raise
+            # Stopped while still queued; the cancelled result is filled in below
+        finally:
+            if result is None and task.cancel_requested:
+                result = _cancelled_result()
+            task.result = result or _aborted_result()
+            task.finished_at = time.time()
+            if task.result.get("success"):
+                task.status = "completed"
+            else:
+                task.status = "cancelled" if task.result.get("cancelled") else "failed"
+            _record_history(self.history, task)
+        return task.result
+
+
+# --- Shared Runner ---
+_runner_instance = None
+_runner_lock = threading.Lock()
+
+
+def get_runner() -> SimpleAgentRunner:
+    """Returns the process-wide runner, constructing it on first use."""
+    global _runner_instance
+    with _runner_lock:
+        if _runner_instance is None:
+            _runner_instance = SimpleAgentRunner()
+        return _runner_instance
+
+
+def __getattr__(name):
+    # Keeps `agent_logic.agent_runner_instance` working without building the runner at import time
+    if name == "agent_runner_instance":
+        return get_runner()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# --- Multi-Process Workers ---
+def _worker_main(worker_id: int, inbox, outbox, slots: int, browser_config, llm_factory, requests_per_second):
+    """Worker process entry point: runs tasks from `inbox` on its own runner and
+    reports logs, step events, status changes and results on `outbox`."""
+    if requests_per_second is not None:
+        os.environ["LLM_REQUESTS_PER_SECOND"] = str(requests_per_second) # This worker's share of the global rate
+    runner = SimpleAgentRunner(max_concurrency=slots, llm=llm_factory() if llm_factory else None, browser_config=browser_config)
+    scheduler = TaskScheduler(runner)
+    warm_up = runner.warm_up()
+    ready_sent = False
+    tasks = {} # parent task id -> [local ScheduledTask, last status sent, events sent]
+    try:
+        while True:
+            if not ready_sent and warm_up.done():
+                error = None if warm_up.cancelled() or warm_up.exception() is None else f"{type(warm_up.exception()).__name__}: {warm_up.exception()}"
+                outbox.put(("ready", worker_id, error))
+                ready_sent = True
+            try:
+                message = inbox.get(timeout=0.05)
+            except queue.Empty:
+                message = ()
+            if message is None:
+                break
+            if message:
+                kind, task_id, command = message
+                if kind == "run":
+                    tasks[task_id] = [scheduler.submit(command), None, 0]
+                elif kind == "cancel" and task_id in tasks:
+                    scheduler.cancel(tasks[task_id][0].id)
+
+            # Forward everything new since the last pass, one batch per task
+            for task_id, entry in list(tasks.items()):
+                task, sent_status, sent_events = entry
+                finished = task.finished # Read before draining so no final log line is missed
+                lines = task.log_queue.drain()
+                if lines:
+                    outbox.put(("logs", task_id, lines))
+                if len(task.events) > sent_events:
+                    entry[2] = len(task.events)
+                    outbox.put(("events", task_id, task.events[sent_events:entry[2]]))
+                if finished:
+                    outbox.put(("result", task_id, (task.status, task.result, task.started_at, task.finished_at)))
+                    scheduler.discard(task.id)
+                    del tasks[task_id]
+                elif task.status != sent_status:
+                    entry[1] = task.status
+                    outbox.put(("status", task_id, (task.status, task.started_at)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        runner.close()
+
+
+class _WorkerProcess:
+    """Parent-side handle of one worker: its process, its inbox and the tasks it is running."""
+    def __init__(self, process, inbox):
+        self.process = process
+        self.inbox = inbox
+        self.running = set()
+        self.ready = threading.Event()
+
+
+class WorkerPoolScheduler(_SchedulerBase):
+    """TaskScheduler counterpart that runs tasks in `workers` separate processes.
+
+    Each worker has its own SimpleAgentRunner (event loop, warm browser pool and
+    rate limiter) and runs up to `slots_per_worker` tasks, so JSON parsing, DOM
+    processing and logging of different tasks don't contend on one GIL. Logs, step
+    events and results come back over multiprocessing queues into ordinary
+    ScheduledTask records, so the GUI and batch mode use either scheduler the same way.
+
+    `llm_factory` (a picklable callable, e.g. for a stub model) builds each worker's
+    LLM; by default workers use the OpenAI settings from .env. LLM_REQUESTS_PER_SECOND
+    is split evenly between the workers. Finished tasks are written to `history`.
+
+    Every worker launches its own browsers: by default Playwright's Chromium. A
+    `browser_config` that attaches to a running Chrome (chrome_instance_path or
+    cdp_url) is refused, since all workers would drive that one Chrome.
+    """
+    def __init__(self, workers: int, slots_per_worker: int = 1, browser_config: BrowserConfig = None, llm_factory=None,
+                 history: TaskHistory = None):
+        if browser_config is None:
+            browser_config = BrowserConfig()
+        elif _is_shared_browser(browser_config):
+            raise ValueError("Worker processes need their own browsers; browser_config must not set chrome_instance_path or cdp_url.")
+        super().__init__(history)
+        self.workers = max(1, workers)
+        self.slots_per_worker = max(1, slots_per_worker)
+        self.max_concurrency = self.workers * self.slots_per_worker
+        requests_per_second = _env_float("LLM_REQUESTS_PER_SECOND", 0.0)
+        self._context = multiprocessing.get_context("spawn") # Same behaviour on Windows and Linux
+        self._outbox = self._context.Queue()
+        self._worker_args = (self.slots_per_worker, browser_config, llm_factory,
+                             requests_per_second / self.workers if requests_per_second > 0 else None)
+        self._pending = collections.deque()
+        self._assigned = {} # task id -> _WorkerProcess running it
+        self._closing = False
+        self._workers = [self._start_worker(i) for i in range(self.workers)]
+        self._collector = threading.Thread(target=self._collect, name="worker-results", daemon=True)
+        self._collector.start()
+
+    def _start_worker(self, worker_id: int) -> _WorkerProcess:
+        inbox = self._context.Queue()
+        process = self._context.Process(
+            target=_worker_main, args=(worker_id, inbox, self._outbox) + self._worker_args,
+            name=f"agent-worker-{worker_id}", daemon=True,
+        )
+        process.start()
+        return _WorkerProcess(process, inbox)
+
+    def _start(self, task: ScheduledTask):
+        task.future = concurrent.futures.Future()
+        self._pending.append(task)
+        self._dispatch()
+
+    def wait_ready(self, timeout: float = None) -> bool:
+        """Blocks until every worker has warmed up its browsers; False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for worker in list(self._workers):
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not worker.ready.wait(remaining):
+                return False
+        return True
+
+    def cancel(self, task_id: int) -> bool:
+        """Stops a queued or running task; it ends with status "cancelled" once cleaned up."""
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None or task.finished or task.cancel_requested:
+                return False
+            task.cancel_requested = True
+            if task in self._pending:
+                self._pending.remove(task)
+                self._finish(task, "cancelled", _cancelled_result())
+            else:
+                self._assigned[task.id].inbox.put(("cancel", task.id, None))
+        return True
+
+    def close(self, timeout: float = 10.0):
+        """Stops the workers (each closes its browsers) and fails tasks that never finished."""
+        with self._lock:
+            self._closing = True
+            for worker in self._workers:
+                worker.inbox.put(None)
+        deadline = time.monotonic() + timeout
+        for worker in self._workers:
+            worker.process.join(max(0.0, deadline - time.monotonic()))
+            if worker.process.is_alive():
+                worker.process.terminate()
+        self._outbox.put(None)
+        self._collector.join(timeout)
+        with self._lock:
+            for task in list(self._tasks.values()):
+                if not task.finished:
+                    self._finish(task, "failed", None)
+            if self.history is not None:
+                self.history.close()
+
+    # Everything below runs with self._lock held, on the caller's or the collector thread
+    def _dispatch(self):
+        """Hands pending tasks to the least busy workers that have a free slot."""
+        while self._pending and not self._closing:
+            free = [worker for worker in self._workers if len(worker.running) < self.slots_per_worker]
+            if not free:
+                return
+            worker = min(free, key=lambda w: len(w.running))
+            task = self._pending.popleft()
+            worker.running.add(task.id)
+            self._assigned[task.id] = worker
+            worker.inbox.put(("run", task.id, task.command))
+
+    def _finish(self, task: ScheduledTask, status: str, result: dict):
+        worker = self._assigned.pop(task.id, None)
+        if worker is not None:
+            worker.running.discard(task.id)
+        task.result = result or _aborted_result()
+        task.finished_at = task.finished_at or time.time()
+        task.status = status
+        _record_history(self.history, task)
+        if not task.future.done():
+            task.future.set_result(task.result)
+
+    def _collect(self):
+        """Applies worker messages to the parent's task records (collector thread)."""
+        last_health_check = time.monotonic()
+        while True:
+            try:
+                message = self._outbox.get(timeout=1.0)
+            except queue.Empty:
+                message = ()
+            if message is None:
+                return
+            with self._lock:
+                if message:
+                    self._apply(*message)
+                if time.monotonic() - last_health_check >= 1.0:
+                    last_health_check = time.monotonic()
+                    self._replace_dead_workers()
+
+    def _apply(self, kind: str, key, payload):
+        if kind == "ready":
+            if payload:
+                print(f"Error warming up worker {key}: {payload}")
+            self._workers[key].ready.set()
+            return
+        task = self._tasks.get(key)
+        if task is None or task.finished:
+            return
+        if kind == "logs":
+            for line in payload:
+                task.log_queue.put(line)
+        elif kind == "events":
+            task.events.extend(payload)
+        elif kind == "status":
+            task.status, task.started_at = payload
+        elif kind == "result":
+            status, result, task.started_at, task.finished_at = payload
+            self._finish(task, status, result)
+            self._dispatch()
+
+    def _replace_dead_workers(self):
+        if self._closing:
+            return
+        for index, worker in enumerate(self._workers):
+            if worker.process.is_alive():
+                continue
+            print(f"Worker {index} exited (code {worker.process.exitcode}), restarting it.")
+            for task_id in list(worker.running):
+                task = self._tasks.get(task_id)
+                if task is not None:
+                    task.log_queue.put("ERROR    [system] Worker process exited unexpectedly.")
+                    task.log_queue.put("--- AGENT TASK FAILED ---")
+                    self._finish(task, "failed", {
+                        "chat_response": "Sorry, the worker running this task crashed.",
+                        "final_output": f"Worker process exited unexpectedly (exit code {worker.process.exitcode}).",
+                        "success": False,
+                    })
+            self._workers[index] = self._start_worker(index)
+        self._dispatch()
+
+
+def create_scheduler():
+    """Scheduler for the GUI: AGENT_WORKER_PROCESSES > 0 runs tasks in that many worker
+    processes (AGENT_MAX_CONCURRENCY tasks each); otherwise they run on the shared runner."""
+    workers = _env_int("AGENT_WORKER_PROCESSES", 0)
+    if workers > 0:
+        return WorkerPoolScheduler(workers, slots_per_worker=_env_int("AGENT_MAX_CONCURRENCY", 1), history=open_task_history())
+    runner = get_runner()
+    runner.warm_up() # Launch the pooled browsers now so the first task doesn't pay Chrome's cold start
+    return TaskScheduler(runner, history=open_task_history())
+
+
+# --- Batch Mode ---
+def _iter_batch_commands(input_path: str):
+    """Yields (record_id, command) from a JSONL file one line at a time."""
+    with open(input_path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                print(f"Skipping line {line_number}: invalid JSON ({e})", file=sys.stderr)
+                continue
+            if isinstance(record, str):
+                record = {"command": record}
+            if not isinstance(record, dict):
+                print(f"Skipping line {line_number}: invalid JSON (expected an object or a string)", file=sys.stderr)
+                continue
+            command = record.get("command") or record.get("task") or record.get("body")
+            if not command:
+                print(f"Skipping line {line_number}: no command/task/body field", file=sys.stderr)
+                continue
+            record_id = record.get("id", record.get("request_id"))
+            if record_id is None:
+                record_id = f"line-{line_number}"
+            yield str(record_id), str(command)
+
+
+def _load_completed_ids(output_path: str) -> set:
+    """Ids that already completed in the output file, so a resumed batch skips them.
+
+    Failed ids are retried; their new result line is appended after the old one.
+    """
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                if record.get("status") == "completed":
+                    completed.add(str(record["id"]))
+            except (json.JSONDecodeError, KeyError, TypeError, AttributeError):
+                pass # Partially written line from an interrupted run
+    return completed
+
+
+def _write_finished_tasks(pending: dict, out, scheduler: TaskScheduler, counts: dict, return_when: str):
+    done, _ = concurrent.futures.wait(list(pending), return_when=return_when)
+    for future in done:
+        record_id, task = pending.pop(future)
+        result = task.result or {}
+        out.write(json.dumps({
+            "id": record_id,
+            "command": task.command,
+            "status": task.status,
+            "success": result.get("success", False),
+            "chat_response": result.get("chat_response"),
+            "final_output": result.get("final_output"),
+            "started_at": task.started_at,
+            "finished_at": task.finished_at,
+            "duration_s": round((task.finished_at or time.time()) - (task.started_at or task.submitted_at), 3),
+            "tokens": result.get("tokens"),
+            "model": result.get("model"),
+            "escalation": result.get("escalation"),
+            "resources": result.get("resources"),
+            "timing": (result.get("timeline") or {}).get("totals"),
+            "trace_path": result.get("trace_path"),
+        }, ensure_ascii=False) + "\n")
+        out.flush() # Each finished line is a checkpoint
+        counts[task.status] = counts.get(task.status, 0) + 1
+        print(f"[{task.status}] {record_id}: {str(result.get('final_output'))[:100]}")
+        scheduler.discard(task.id)
+
+
+def run_batch(input_path: str, output_path: str = None, parallel: int = None, workers: int = None) -> dict:
+    """Runs every command in a JSONL file, appending one result line per command as it finishes.
+
+    Commands that already completed in the output file are skipped, so an interrupted
+    batch resumes where it stopped and failed commands are retried. Only about 2x `parallel` commands are held in memory.
+    With `workers` (default: AGENT_WORKER_PROCESSES) tasks run in that many processes, `parallel` in total.
+    """
+    output_path = output_path or os.path.splitext(input_path)[0] + ".results.jsonl"
+    completed_ids = _load_completed_ids(output_path)
+    workers = workers if workers is not None else _env_int("AGENT_WORKER_PROCESSES", 0)
+    if workers > 0:
+        scheduler = WorkerPoolScheduler(workers, slots_per_worker=-(-(parallel or workers) // workers), history=open_task_history())
+    else:
+        scheduler = TaskScheduler(SimpleAgentRunner(max_concurrency=parallel), history=open_task_history())
+    counts = {"completed": 0, "failed": 0, "skipped": 0}
+    pending = {} # future -> (record id, task)
+
+    # Start on a fresh line if a previous run died mid-write
+    if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
+        with open(output_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            needs_newline = f.read(1) != b"\n"
+    else:
+        needs_newline = False
+
+    try:
+        with open(output_path, "a", encoding="utf-8") as out:
+            if needs_newline:
+                out.write("\n")
+            for record_id, command in _iter_batch_commands(input_path):
+                if record_id in completed_ids:
+                    counts["skipped"] += 1
+                    continue
+                task = scheduler.submit(command)
+                pending[task.future] = (record_id, task)
+                # Keep a small backlog queued ahead of the running tasks
+                if len(pending) >= scheduler.max_concurrency * 2:
+                    _write_finished_tasks(pending, out, scheduler, counts, concurrent.futures.FIRST_COMPLETED)
+            while pending:
+                _write_finished_tasks(pending, out, scheduler, counts, concurrent.futures.FIRST_COMPLETED)
+    finally:
+        scheduler.close()
+    return counts
+
+
+def _run_self_test():
     print("Testing simplified agent_logic.py (Targeted Handler Logging)...")
     print("NOTE: Real-time logs require a queue consumer (like the GUI).")
     test_queue = queue.Queue()
@@ -159,7 +2310,7 @@ if __name__ == '__main__':
                  # Check for final messages
                  if "--- AGENT TASK" in msg:
                      finished = True # Allow loop to potentially get Browser closed msg
-                 if "Browser closed" in msg and finished:
+                 if "Browser returned to pool" in msg and finished:
                       break # Exit after browser closed if task was already finished/failed
              except queue.Empty:
                  print("--- Queue empty, assuming finished ---")
@@ -176,9 +2327,32 @@ if __name__ == '__main__':
     result_dict = runner.run_task(test_task, test_queue)
 
     consumer_thread.join(timeout=3.0) # Wait a bit longer for consumer thread
+    runner.close()
 
     print("\n--- Chat Response ---")
     print(result_dict.get('chat_response', 'N/A'))
     print("\n--- Final Output ---")
     print(result_dict.get('final_output', 'N/A'))
-    print("\nTest finished.")
\ No newline at end of file
+    print("\nTest finished.")
+
+
+def _main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m agent_logic", description="Run browser agent tasks without the GUI.")
+    subparsers = parser.add_subparsers(dest="mode")
+    batch_parser = subparsers.add_parser("batch", help="Run commands from a JSONL file and stream results to a JSONL file.")
+    batch_parser.add_argument("input", help="JSONL file; each line has a 'command' (or 'task'/'body') and optional 'id'.")
+    batch_parser.add_argument("-o", "--output", help="Results JSONL file (default: <input>.results.jsonl). Completed ids are skipped.")
+    batch_parser.add_argument("-p", "--parallel", type=int, default=None, help="Tasks to run at once (default: AGENT_MAX_CONCURRENCY).")
+    batch_parser.add_argument("-w", "--workers", type=int, default=None, help="Worker processes to spread tasks over (default: AGENT_WORKER_PROCESSES, 0 = in-process).")
+    args = parser.parse_args(argv)
+
+    if args.mode == "batch":
+        counts = run_batch(args.input, args.output, args.parallel, args.workers)
+        print(f"Batch finished: {counts['completed']} completed, {counts['failed']} failed, {counts['skipped']} skipped.")
+    else:
+        _run_self_test()
+
+
+# Keep the __main__ block for standalone testing if desired
+if __name__ == '__main__':
+    _main()
@@ -0,0 +1,297 @@
+import re
+import json
+import time
+import asyncio
+import argparse
+import functools
+import itertools
+import collections
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+import agent_logic
+from browser_use import BrowserConfig
+
+MAX_BODY_BYTES = 64 * 1024
+LOG_POLL_SECONDS = 0.1
+TASK_PATH = re.compile(r"^/tasks/(\d+)(/result|/logs)?$")
+
+
+# --- Per-Task Log Buffer ---
+class TaskLog:
+    """Log lines of one task shared by every SSE client; lines beyond `max_lines` are dropped oldest first."""
+    def __init__(self, max_lines: int):
+        self.lines = collections.deque(maxlen=max_lines)
+        self.total = 0 # Lines ever added; a client's cursor counts from here
+
+    def extend(self, lines: list):
+        self.lines.extend(lines)
+        self.total += len(lines)
+
+    def since(self, cursor: int):
+        """Returns (lines after `cursor` still buffered, new cursor)."""
+        first = self.total - len(self.lines)
+        return list(itertools.islice(self.lines, max(0, cursor - first), None)), self.total
+
+
+# --- HTTP Server ---
+class ApiServer:
+    """Small HTTP/JSON front end for a TaskScheduler (or WorkerPoolScheduler).
+
+    POST /tasks               {"command": "..."} -> 202 with the task id, 429 when full
+    GET  /tasks               all tasks the server still remembers
+    GET  /tasks/<id>          status and timestamps
+    GET  /tasks/<id>/result   result once finished (202 while running; ?wait=<s> to long-poll)
+    GET  /tasks/<id>/logs     Server-Sent Events: log lines, step events, then "end"
+    DELETE /tasks/<id>        cancel a queued or running task
+    GET  /health              queue depth and limits
+
+    At most `max_queue` tasks may be queued or running; further submissions get 429
+    with Retry-After so callers back off instead of piling up work.
+    """
+    def __init__(self, scheduler, max_queue: int = 100, max_finished: int = 1000):
+        self.scheduler = scheduler
+        self.max_queue = max(1, max_queue)
+        self.max_finished = max(0, max_finished)
+        self.logs = {} # task id -> TaskLog
+        self._finished_ids = collections.deque() # Oldest first, for pruning
+
+    async def serve(self, host: str, port: int):
+        server = await asyncio.start_server(self._handle, host, port)
+        collector = asyncio.ensure_future(self._collect_logs())
+        print(f"Agent API listening on http://{host}:{server.sockets[0].getsockname()[1]}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            collector.cancel()
+
+    def active_count(self) -> int:
+        return sum(1 for task in self.scheduler.list_tasks() if not task.finished)
+
+    async def _collect_logs(self):
+        """Moves each task's queued log lines into its shared buffer and forgets old finished tasks."""
+        while True:
+            for task in self.scheduler.list_tasks():
+                log = self.logs.get(task.id)
+                if log is None:
+                    continue
+                finished = task.finished # Read before draining so no final log line is missed
+                lines = task.log_queue.drain()
+                if lines:
+                    log.extend(lines)
+                if finished and task.id not in self._finished_ids:
+                    self._finished_ids.append(task.id)
+            while len(self._finished_ids) > self.max_finished:
+                task_id = self._finished_ids.popleft()
+                self.scheduler.discard(task_id)
+                self.logs.pop(task_id, None)
+            await asyncio.sleep(LOG_POLL_SECONDS)
+
+    # --- Request Handling ---
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            method, path, query, body = await self._read_request(reader)
+            await self._route(writer, method, path, query, body)
+        except _HttpError as e:
+            await self._send_json(writer, e.status, {"error": e.message})
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            pass # Client went away
+        except Exception as e:
+            print(f"Error handling API request: {type(e).__name__}: {e}")
+            try:
+                await self._send_json(writer, HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "Internal server error."})
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader):
+        request_line = (await asyncio.wait_for(reader.readline(), 30)).decode("latin-1").strip()
+        if not request_line:
+            raise asyncio.IncompleteReadError(b"", None)
+        parts = request_line.split(" ")
+        if len(parts) != 3:
+            raise _HttpError(HTTPStatus.BAD_REQUEST, "Malformed request line.")
+        headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), 30)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length") or 0)
+        except ValueError:
+            raise _HttpError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length.")
+        if length > MAX_BODY_BYTES:
+            raise _HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Body larger than {MAX_BODY_BYTES} bytes.")
+        body = await asyncio.wait_for(reader.readexactly(length), 30) if length else b""
+        url = urlsplit(parts[1])
+        return parts[0].upper(), url.path.rstrip("/") or "/", parse_qs(url.query), body
+
+    async def _route(self, writer, method: str, path: str, query: dict, body: bytes):
+        if path == "/health" and method == "GET":
+            return await self._send_json(writer, HTTPStatus.OK, {
+                "status": "ok",
+                "active": self.active_count(),
+                "max_queue": self.max_queue,
+                "max_concurrency": self.scheduler.max_concurrency,
+            })
+        if path == "/tasks":
+            if method == "POST":
+                return await self._submit(writer, body)
+            if method == "GET":
+                return await self._send_json(writer, HTTPStatus.OK, {"tasks": [self._summary(t) for t in self.scheduler.list_tasks()]})
+            raise _HttpError(HTTPStatus.METHOD_NOT_ALLOWED, "Use GET or POST.")
+        match = TASK_PATH.match(path)
+        if not match:
+            raise _HttpError(HTTPStatus.NOT_FOUND, "No such endpoint.")
+        task = self.scheduler.get(int(match.group(1)))
+        if task is None:
+            raise _HttpError(HTTPStatus.NOT_FOUND, "No such task.")
+        action = match.group(2)
+        if action is None and method == "GET":
+            return await self._send_json(writer, HTTPStatus.OK, self._summary(task))
+        if action is None and method == "DELETE":
+            cancelled = self.scheduler.cancel(task.id)
+            return await self._send_json(writer, HTTPStatus.ACCEPTED if cancelled else HTTPStatus.CONFLICT,
+                                         {**self._summary(task), "cancel_requested": cancelled})
+        if action == "/result" and method == "GET":
+            return await self._result(writer, task, query)
+        if action == "/logs" and method == "GET":
+            return await self._stream_logs(writer, task)
+        raise _HttpError(HTTPStatus.METHOD_NOT_ALLOWED, "Method not allowed here.")
+
+    async def _submit(self, writer, body: bytes):
+        try:
+            payload = json.loads(body or b"{}")
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            raise _HttpError(HTTPStatus.BAD_REQUEST, "Body must be JSON.")
+        command = payload.get("command") if isinstance(payload, dict) else None
+        if not isinstance(command, str) or not command.strip():
+            raise _HttpError(HTTPStatus.BAD_REQUEST, "Missing 'command'.")
+        if self.active_count() >= self.max_queue:
+            return await self._send_json(writer, HTTPStatus.TOO_MANY_REQUESTS,
+                                         {"error": f"Queue full ({self.max_queue} tasks queued or running)."},
+                                         headers={"Retry-After": "1"})
+        task = self.scheduler.submit(command.strip())
+        self.logs[task.id] = TaskLog(agent_logic.LOG_QUEUE_MAX_LINES)
+        return await self._send_json(writer, HTTPStatus.ACCEPTED, self._summary(task),
+                                     headers={"Location": f"/tasks/{task.id}"})
+
+    async def _result(self, writer, task, query: dict):
+        try:
+            wait_s = min(300.0, float(query.get("wait", ["0"])[0]))
+        except ValueError:
+            raise _HttpError(HTTPStatus.BAD_REQUEST, "'wait' must be a number of seconds.")
+        deadline = time.monotonic() + wait_s
+        while not task.finished and time.monotonic() < deadline:
+            await asyncio.sleep(LOG_POLL_SECONDS)
+        if not task.finished:
+            return await self._send_json(writer, HTTPStatus.ACCEPTED, self._summary(task))
+        return await self._send_json(writer, HTTPStatus.OK, {**self._summary(task), "result": task.result})
+
+    async def _stream_logs(self, writer, task):
+        """Sends the task's log lines and step events as Server-Sent Events until it finishes."""
+        writer.write(
+            b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\nConnection: close\r\n\r\n"
+        )
+        log = self.logs.get(task.id) or TaskLog(1)
+        cursor, events_sent = 0, 0
+        while True:
+            # The collector drains a queue into its buffer without yielding, so an empty
+            # queue after finishing means every line is already in `log`
+            done = task.finished and task.log_queue.empty()
+            lines, new_cursor = log.since(cursor)
+            chunks = [_sse("log", line, event_id=new_cursor - len(lines) + i) for i, line in enumerate(lines)]
+            cursor = new_cursor
+            new_events = task.events[events_sent:]
+            events_sent += len(new_events)
+            chunks += [_sse(event.get("type", "step"), json.dumps(event, ensure_ascii=False)) for event in new_events]
+            if done:
+                chunks.append(_sse("end", json.dumps(self._summary(task))))
+            if chunks:
+                writer.write("".join(chunks).encode("utf-8"))
+                await writer.drain()
+            if done:
+                return
+            await asyncio.sleep(LOG_POLL_SECONDS)
+
+    def _summary(self, task) -> dict:
+        return {
+            "id": task.id,
+            "command": task.command,
+            "status": task.status,
+            "submitted_at": task.submitted_at,
+            "started_at": task.started_at,
+            "finished_at": task.finished_at,
+            "steps": sum(1 for event in task.events if event.get("type") == "step"),
+        }
+
+    async def _send_json(self, writer, status: HTTPStatus, payload: dict, headers: dict = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = f"HTTP/1.1 {status.value} {status.phrase}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\nConnection: close\r\n"
+        for name, value in (headers or {}).items():
+            head += f"{name}: {value}\r\n"
+        writer.write(head.encode("latin-1") + b"\r\n" + body)
+        await writer.drain()
+
+
+class _HttpError(Exception):
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _sse(event: str, data: str, event_id: int = None) -> str:
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines += [f"data: {line}" for line in str(data).split("\n")]
+    return "\n".join(lines) + "\n\n"
+
+
+# --- Entry Point ---
+def _build_scheduler(args):
+    workers = args.workers if args.workers is not None else agent_logic._env_int("AGENT_WORKER_PROCESSES", 0)
+    llm_factory, browser_config = None, None
+    if args.stub_llm:
+        import benchmark # Scripted offline model; browsers run headless
+        llm_factory = functools.partial(benchmark.scripted_llm, args.llm_latency)
+        browser_config = BrowserConfig(headless=True)
+    if workers > 0:
+        return agent_logic.WorkerPoolScheduler(
+            workers,
+            slots_per_worker=args.parallel or agent_logic._env_int("AGENT_MAX_CONCURRENCY", 1),
+            browser_config=browser_config,
+            llm_factory=llm_factory,
+            history=agent_logic.open_task_history(),
+        )
+    runner = agent_logic.SimpleAgentRunner(max_concurrency=args.parallel, llm=llm_factory() if llm_factory else None, browser_config=browser_config)
+    runner.warm_up() # Launch the pooled browsers before the first request arrives
+    return agent_logic.TaskScheduler(runner, history=agent_logic.open_task_history())
+
+
+def _main(argv=None):
+    parser = argparse.ArgumentParser(description="HTTP/JSON API for submitting and following agent tasks.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on (default: 127.0.0.1). There is no authentication.")
+    parser.add_argument("--port", type=int, default=8765, help="Port to listen on (default: 8765).")
+    parser.add_argument("--max-queue", type=int, default=agent_logic._env_int("API_MAX_QUEUE", 100), help="Tasks allowed queued or running before 429 (default: API_MAX_QUEUE or 100).")
+    parser.add_argument("-p", "--parallel", type=int, default=None, help="Tasks to run at once (per worker with --workers; default: AGENT_MAX_CONCURRENCY).")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Worker processes (default: AGENT_WORKER_PROCESSES, 0 = in-process).")
+    parser.add_argument("--stub-llm", action="store_true", help="Use the benchmark's scripted offline model instead of OpenAI (headless browsers).")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Simulated seconds per stub LLM call (default: 0).")
+    args = parser.parse_args(argv)
+
+    scheduler = _build_scheduler(args)
+    try:
+        asyncio.run(ApiServer(scheduler, max_queue=args.max_queue).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        scheduler.close()
+
+
+if __name__ == "__main__":
+    _main()
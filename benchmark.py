@@ -0,0 +1,305 @@
+import os
+import re
+import math
+import sys
+import json
+import time
+import logging
+import asyncio
+import argparse
+import functools
+import threading
+import subprocess
+import http.server
+import platform
+import psutil
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import RunnableLambda
+from browser_use import BrowserConfig
+import agent_logic
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_fixtures")
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_results")
+FIXTURE_PAGES = ["page1.html", "page2.html", "page3.html", "page4.html", "page5.html"]
+
+
+# --- Scripted Stub LLM ---
+def _message_text(message) -> str:
+    if isinstance(message.content, str):
+        return message.content
+    return " ".join(part.get("text", "") for part in message.content if isinstance(part, dict))
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Offline stand-in for ChatOpenAI that drives the agent through a fixed script.
+
+    Step 1 opens the first URL found in the task, step 2 extracts the page content,
+    step 3 finishes with the extracted text. Page-extraction prompts (no system
+    message) are answered with the first line of the page. `latency_s` simulates
+    model latency on the async path the agent uses for its decisions.
+    """
+    latency_s: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        text = self._respond(messages)
+        input_chars = sum(len(_message_text(message)) for message in messages)
+        message = AIMessage(content=text, usage_metadata={
+            "input_tokens": input_chars // 4,
+            "output_tokens": len(text) // 4,
+            "total_tokens": (input_chars + len(text)) // 4,
+        })
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        return self._generate(messages, stop=stop, **kwargs)
+
+    def with_structured_output(self, schema, *, include_raw: bool = False, **kwargs):
+        """Parses the scripted JSON into `schema`, as tool calling would for ChatOpenAI."""
+        def parse(message):
+            parsed = schema(**json.loads(message.content))
+            if include_raw:
+                return {"raw": message, "parsed": parsed, "parsing_error": None}
+            return parsed
+        return self | RunnableLambda(parse)
+
+    def _respond(self, messages) -> str:
+        if not any(isinstance(message, SystemMessage) for message in messages):
+            # extract_content action: answer with the first line of the page
+            page = _message_text(messages[-1]).split("Page:", 1)[-1]
+            first_line = next((line.strip() for line in page.splitlines() if line.strip()), "")
+            return json.dumps({"title": first_line})
+
+        step = max(0, sum(isinstance(message, AIMessage) for message in messages) - 1) # First AI message is browser_use's example
+        task = next((_message_text(m) for m in messages if isinstance(m, HumanMessage) and "ultimate task" in _message_text(m)), "")
+        url = re.search(r"https?://[^\s\"']+", task)
+        if step == 0:
+            action = {"go_to_url": {"url": url.group(0) if url else "about:blank"}}
+        elif step == 1:
+            action = {"extract_content": {"goal": "page title"}}
+        else:
+            extracted = [_message_text(m) for m in messages if isinstance(m, HumanMessage) and _message_text(m).startswith("Action result:")]
+            action = {"done": {"text": extracted[-1] if extracted else "No content extracted.", "success": True}}
+        return json.dumps({
+            "current_state": {
+                "evaluation_previous_goal": "Success",
+                "memory": f"Scripted step {step + 1}",
+                "next_goal": next(iter(action)),
+            },
+            "action": [action],
+        })
+
+
+def scripted_llm(latency_s: float = 0.0) -> ScriptedChatModel:
+    """Builds the stub model with timeline callbacks; module-level so worker processes can call it."""
+    return ScriptedChatModel(latency_s=latency_s, callbacks=[agent_logic.TimelineCallbackHandler()])
+
+
+# --- Fixture Server ---
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fixture_server(directory: str = FIXTURE_DIR):
+    """Serves the fixture pages on a free localhost port; returns (server, base_url)."""
+    handler = functools.partial(_QuietHandler, directory=directory)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, name="fixture-server", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+# --- Measurement ---
+class RssSampler(threading.Thread):
+    """Tracks peak resident memory of this process plus all children (Playwright driver, Chrome)."""
+    def __init__(self, interval: float = 0.1):
+        super().__init__(name="rss-sampler", daemon=True)
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        process = psutil.Process()
+        while not self._stop_event.is_set():
+            total = 0
+            for proc in [process] + process.children(recursive=True):
+                try:
+                    total += proc.memory_info().rss
+                except psutil.Error:
+                    pass
+            self.peak_bytes = max(self.peak_bytes, total)
+            self._stop_event.wait(self.interval)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _percentile(sorted_values: list, fraction: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def _start_scheduler(concurrency: int, latency_s: float, headless: bool, workers: bool):
+    """Returns (scheduler, startup seconds) with every browser warmed up."""
+    start = time.perf_counter()
+    if workers:
+        # One process per concurrency slot; identical commands must not be served from cache
+        os.environ["RESULT_CACHE_PATH"] = ""
+        os.environ["TRACE_DIR"] = ""
+        scheduler = agent_logic.WorkerPoolScheduler(
+            concurrency,
+            browser_config=BrowserConfig(headless=headless),
+            llm_factory=functools.partial(scripted_llm, latency_s),
+        )
+        scheduler.wait_ready()
+        return scheduler, time.perf_counter() - start
+    runner = agent_logic.SimpleAgentRunner(
+        max_concurrency=concurrency,
+        llm=scripted_llm(latency_s),
+        browser_config=BrowserConfig(headless=headless),
+        pool_size=concurrency,
+    )
+    runner.result_cache = None # Identical commands must not be served from cache
+    runner.trace_dir = None
+    scheduler = agent_logic.TaskScheduler(runner)
+    try:
+        runner.warm_up().result()
+    except BaseException:
+        scheduler.close()
+        raise
+    return scheduler, time.perf_counter() - start
+
+
+def run_level(concurrency: int, commands: list, latency_s: float, headless: bool = True, workers: bool = False) -> dict:
+    """Runs all commands at one concurrency level with a fresh runner (or worker
+    processes, one per slot) and returns its metrics."""
+    sampler = RssSampler()
+    sampler.start()
+    scheduler = None
+    try:
+        scheduler, startup_s = _start_scheduler(concurrency, latency_s, headless, workers)
+        start = time.perf_counter()
+        tasks = [scheduler.submit(command) for command in commands]
+        for task in tasks:
+            task.future.result()
+        wall_s = time.perf_counter() - start
+    finally:
+        if scheduler is not None:
+            scheduler.close()
+        sampler.stop()
+
+    latencies = sorted(task.finished_at - task.started_at for task in tasks)
+    first_actions = []
+    span_totals = {}
+    for task in tasks:
+        timeline = (task.result or {}).get("timeline") or {}
+        action_starts = [span["start"] for span in timeline.get("spans", []) if span["name"] == "browser.actions"]
+        if action_starts:
+            first_actions.append(min(action_starts))
+        for name, entry in timeline.get("totals", {}).get("spans", {}).items():
+            span_totals[name] = span_totals.get(name, 0.0) + entry["total_s"]
+    return {
+        "concurrency": concurrency,
+        "mode": "processes" if workers else "in-process",
+        "tasks": len(tasks),
+        "failed": sum(1 for task in tasks if task.status != "completed"),
+        "wall_s": round(wall_s, 3),
+        "tasks_per_s": round(len(tasks) / wall_s, 3) if wall_s else 0.0,
+        "p50_latency_s": round(_percentile(latencies, 0.50), 3),
+        "p95_latency_s": round(_percentile(latencies, 0.95), 3),
+        "browser_startup_s": round(startup_s, 3),
+        "mean_first_action_s": round(sum(first_actions) / len(first_actions), 3) if first_actions else None,
+        "peak_rss_mb": round(sampler.peak_bytes / (1024 * 1024), 1),
+        "mean_span_s": {name: round(total / len(tasks), 3) for name, total in sorted(span_totals.items())},
+    }
+
+
+# --- Results ---
+def _git_revision() -> str:
+    try:
+        revision = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+        dirty = subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], stderr=subprocess.DEVNULL, text=True).strip()
+        return revision + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save_results(results: dict, output_dir: str = RESULTS_DIR) -> str:
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"{results['revision']}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def print_comparison(current: dict, baseline: dict):
+    """Prints throughput and latency changes per concurrency level against a saved run."""
+    print(f"\nComparison against {baseline.get('revision')} ({baseline.get('timestamp')}):")
+    baseline_levels = {(level["concurrency"], level.get("mode", "in-process")): level for level in baseline.get("levels", [])}
+    for level in current["levels"]:
+        old = baseline_levels.get((level["concurrency"], level["mode"]))
+        if old is None:
+            continue
+        for metric in ("tasks_per_s", "p50_latency_s", "p95_latency_s", "browser_startup_s", "peak_rss_mb"):
+            before, after = old.get(metric), level.get(metric)
+            if before:
+                print(f"  c={level['concurrency']:<3} {metric:<18} {before:>10} -> {after:<10} ({(after - before) / before:+.1%})")
+
+
+def _main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark of SimpleAgentRunner with a scripted LLM and local fixture pages.")
+    parser.add_argument("-n", "--tasks", type=int, default=20, help="Tasks per concurrency level (default: 20).")
+    parser.add_argument("-c", "--concurrency", type=int, nargs="+", default=[1, 2, 4], help="Concurrency levels to measure (default: 1 2 4).")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Simulated seconds per agent LLM call (default: 0).")
+    parser.add_argument("--headful", action="store_true", help="Show the browser windows instead of running headless.")
+    parser.add_argument("--workers", action="store_true", help="Run each concurrency slot in its own worker process.")
+    parser.add_argument("--output-dir", default=RESULTS_DIR, help="Where to save the results JSON (default: bench_results/).")
+    parser.add_argument("--compare", help="A previously saved results JSON to compare against.")
+    args = parser.parse_args(argv)
+
+    # Keep browser_use's console output to warnings; task logs still reach each task's queue
+    for logger_name in (None, "browser_use"):
+        for handler in logging.getLogger(logger_name).handlers:
+            handler.setLevel(logging.WARNING)
+
+    server, base_url = start_fixture_server()
+    commands = [f"Open {base_url}/{FIXTURE_PAGES[i % len(FIXTURE_PAGES)]} and report the page title" for i in range(args.tasks)]
+    results = {
+        "revision": _git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "llm_latency_s": args.llm_latency,
+        "levels": [],
+    }
+    try:
+        for concurrency in args.concurrency:
+            print(f"Running {args.tasks} tasks at concurrency {concurrency}...")
+            level = run_level(concurrency, commands, args.llm_latency, headless=not args.headful, workers=args.workers)
+            results["levels"].append(level)
+            print(f"  {level['tasks_per_s']} tasks/s, p50 {level['p50_latency_s']} s, p95 {level['p95_latency_s']} s, "
+                  f"startup {level['browser_startup_s']} s, peak RSS {level['peak_rss_mb']} MB, {level['failed']} failed")
+    finally:
+        server.shutdown()
+
+    path = save_results(results, args.output_dir)
+    print(f"\nResults saved to {path}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            print_comparison(results, json.load(f))
+
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,86 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ["TASK_HISTORY_PATH"] = "off"
+os.environ["RESULT_CACHE_PATH"] = ""
+
+import agent_logic
+from browser_use import BrowserConfig
+
+
+class StubRunner(agent_logic.SimpleAgentRunner):
+    """Runner whose tasks succeed unless the command contains "fail"; no browser or LLM is used."""
+    commands = []
+
+    def __init__(self, max_concurrency=None):
+        super().__init__(max_concurrency=max_concurrency or 2, llm=object(), browser_config=BrowserConfig(headless=True))
+
+    async def _execute_uncached(self, user_command, log_queue, on_event=None):
+        StubRunner.commands.append(user_command)
+        success = "fail" not in user_command
+        return {"chat_response": "", "final_output": f"done: {user_command}", "success": success}
+
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        StubRunner.commands = []
+        self.dir = tempfile.TemporaryDirectory()
+        self.input = os.path.join(self.dir.name, "tasks.jsonl")
+        self.output = os.path.join(self.dir.name, "results.jsonl")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write_input(self, lines):
+        with open(self.input, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def run_batch(self):
+        with mock.patch.object(agent_logic, "SimpleAgentRunner", StubRunner), contextlib.redirect_stdout(io.StringIO()):
+            return agent_logic.run_batch(self.input, self.output, parallel=2, workers=0)
+
+    def results(self):
+        with open(self.output, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def test_parses_records_and_skips_bad_lines(self):
+        self.write_input([
+            '{"id": 0, "command": "first"}',
+            '"plain string"',
+            '{"task": "from task field"}',
+            '5',
+            '["x"]',
+            'not json',
+            '{"id": "no-command"}',
+        ])
+        stderr = io.StringIO()
+        with contextlib.redirect_stderr(stderr):
+            records = list(agent_logic._iter_batch_commands(self.input))
+        self.assertEqual(records, [("0", "first"), ("line-2", "plain string"), ("line-3", "from task field")])
+        self.assertIn("Skipping line 4: invalid JSON", stderr.getvalue())
+        self.assertIn("Skipping line 5: invalid JSON", stderr.getvalue())
+        self.assertIn("Skipping line 7: no command/task/body field", stderr.getvalue())
+
+    def test_resume_skips_completed_and_retries_failed(self):
+        self.write_input(['{"id": "a", "command": "ok a"}', '{"id": "b", "command": "fail b"}', '5'])
+        with contextlib.redirect_stderr(io.StringIO()):
+            counts = self.run_batch()
+        self.assertEqual((counts["completed"], counts["failed"], counts["skipped"]), (1, 1, 0))
+        self.assertEqual({r["id"]: r["status"] for r in self.results()}, {"a": "completed", "b": "failed"})
+
+        StubRunner.commands = []
+        with contextlib.redirect_stderr(io.StringIO()):
+            counts = self.run_batch()
+        self.assertEqual(counts["skipped"], 1)
+        self.assertEqual(StubRunner.commands, ["fail b"])
+        self.assertEqual(sorted(r["id"] for r in self.results()), ["a", "b", "b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import agent_logic
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import HumanMessage
+
+
+def state_message(now, page="Example page"):
+    return [HumanMessage(content=f"Current url: http://localhost/\n{page}\nCurrent date and time: {now}")]
+
+
+class LLMResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "llm_cache.sqlite")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def model(self, mode):
+        # the responses list is part of the fake model's llm_string, so both runs share it
+        cache = agent_logic.LLMResponseCache(self.path, mode)
+        self.addCleanup(cache._conn.close)
+        return FakeListChatModel(responses=["recorded answer"], cache=cache), cache
+
+    def test_replay_matches_across_timestamps(self):
+        llm, _ = self.model("record")
+        self.assertEqual(llm.invoke(state_message("2024-05-01 09:15")).content, "recorded answer")
+
+        llm, cache = self.model("replay")
+        self.assertEqual(llm.invoke(state_message("2024-05-02 17:42")).content, "recorded answer")
+        self.assertEqual((cache.stats()["hits"], cache.stats()["misses"]), (1, 0))
+
+    def test_replay_misses_on_different_page(self):
+        llm, _ = self.model("record")
+        llm.invoke(state_message("2024-05-01 09:15"))
+
+        llm, _ = self.model("replay")
+        with self.assertRaises(agent_logic.LLMReplayMissError):
+            llm.invoke(state_message("2024-05-01 09:15", page="Other page"))
+
+
+if __name__ == "__main__":
+    unittest.main()